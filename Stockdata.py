@@ -1,120 +1,279 @@
 import streamlit as st
-import requests
-import base64
-from io import BytesIO
+import html
+import os
+import re
+import time
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import as_completed
+import export
+import fundamentals
+import iexclient
+import memo
+import planner
+import prefetch
+import prices
+import streaming
+import timeseries
 
 
 
-@st.cache(suppress_st_warning=True)
 def format_number(number):
+    if number is None:
+        return 'n/a'
     return f"{number:,}"
 
 
-@st.cache(suppress_st_warning=True)
+IEX_ENVIRONMENT = os.environ.get('IEX_ENVIRONMENT', 'production')  # 'production', 'sandbox' or a base URL
+LIVE_MINUTES = float(os.environ.get('IEX_LIVE_MINUTES', 30))  # streamed quotes cost credits, so a forgotten tab stops
+LIVE_RENDER_INTERVAL = 0.25  # seconds; quotes arriving faster than this are conflated
+BATCH_LIMIT = 100
+# Batch types and the single-symbol paths they stand in for, so both share cache entries
+BATCH_PATHS = {
+    'logo': 'stock/{symbol}/logo',
+    'quote': 'stock/{symbol}/quote',
+    'company': 'stock/{symbol}/company',
+    'news': 'stock/{symbol}/news/last/{last}',
+    'advanced-stats': 'stock/{symbol}/advanced-stats',
+    'intraday-prices': 'stock/{symbol}/intraday-prices',
+}
+
+
 class IEXStock:
-    def __init__(self, token, symbol, environment='production'):
+    def __init__(self, token, symbol, environment=IEX_ENVIRONMENT):
         if environment == 'production':
             self.BASE_URL = 'https://cloud.iexapis.com/v1'
+            self.STREAM_URL = 'https://cloud-sse.iexapis.com/v1/stocksUS1Second'
+        elif environment.startswith(('http://', 'https://')):
+            self.BASE_URL = environment.rstrip('/')  # e.g. a local mockiex server
+            self.STREAM_URL = f"{self.BASE_URL}/stocksUS1Second"
         else:
             self.BASE_URL = 'https://sandbox.iexapis.com/v1'
+            self.STREAM_URL = 'https://sandbox-sse.iexapis.com/v1/stocksUS1Second'
 
         self.token = token
         self.symbol = symbol
 
-    @st.cache(suppress_st_warning=True)
+    def _get(self, endpoint, path, **params):
+        params['token'] = self.token
+        return iexclient.get(endpoint, f"{self.BASE_URL}/{path}", params, symbol=self.symbol)
+
     def get_logo(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/logo?token={self.token}"
-        r = requests.get(url)
-        return r.json()
+        return self._get('logo', f"stock/{self.symbol}/logo")
 
-    @st.cache(suppress_st_warning=True)
     def get_quote(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/quote?token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
+        return self._get('quote', f"stock/{self.symbol}/quote")
 
-    @st.cache(suppress_st_warning=True)
     def get_company_info(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/company?token={self.token}"
-        r = requests.get(url)
+        return self._get('company', f"stock/{self.symbol}/company")
 
-        return r.json()
-
-    @st.cache(suppress_st_warning=True)
     def get_company_news(self, last=10):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/news/last/{last}?token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
+        return self._get('news', f"stock/{self.symbol}/news/last/{last}")
 
-    @st.cache(suppress_st_warning=True)
     def get_stats(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/advanced-stats?token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
+        return self._get('advanced-stats', f"stock/{self.symbol}/advanced-stats")
 
-    @st.cache(suppress_st_warning=True)
     def get_fundamentalsquarterly(self, period='quarterly', last=4):
-        url = f"{self.BASE_URL}/time-series/fundamentals/{self.symbol}/{period}?last={last}&token={self.token}"
-        r = requests.get(url)
+        return self._get('time-series/fundamentals', f"time-series/fundamentals/{self.symbol}/{period}", last=last)
 
-        return r.json()
-
-    @st.cache(suppress_st_warning=True)
     def get_fundamentalsannual(self, period='annual', last=4):
-        url = f"{self.BASE_URL}/time-series/fundamentals/{self.symbol}/{period}?last={last}&token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
+        return self._get('time-series/fundamentals', f"time-series/fundamentals/{self.symbol}/{period}", last=last)
 
-    @st.cache(suppress_st_warning=True)
     def get_fundamentalsannual1(self, period='annual', last=4):
-        url = f"{self.BASE_URL}/time-series/FUNDAMENTAL_VALUATIONS/{self.symbol}/{period}?last={last}&token={self.token}"
-        r = requests.get(url)
+        return self._get('time-series/FUNDAMENTAL_VALUATIONS', f"time-series/FUNDAMENTAL_VALUATIONS/{self.symbol}/{period}", last=last)
 
-        return r.json()
+    def get_chart(self, range='max', **params):
+        """Daily closes; chartLast=n returns only the last n bars.
+        Not cached: prices.sync keeps the bars, and a cached answer could hide the day's new one.
+        """
+        params.update(chartCloseOnly='true', token=self.token)
+        return iexclient.fetch_shared('chart', f"{self.BASE_URL}/stock/{self.symbol}/chart/{range}", params)
 
-    @st.cache(suppress_st_warning=True)
-    def get_dividends(self, range='5y'):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/dividends/{range}?token={self.token}"
-        r = requests.get(url)
+    def get_intraday_prices(self):
+        return self._get('intraday-prices', f"stock/{self.symbol}/intraday-prices")
 
-        return r.json()
+    def get_dividends(self, range='5y'):
+        return self._get('dividends', f"stock/{self.symbol}/dividends/{range}")
 
-    @st.cache(suppress_st_warning=True)
     def get_institutional_ownership(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/institutional-ownership?token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
+        return self._get('institutional-ownership', f"stock/{self.symbol}/institutional-ownership")
 
-    @st.cache(suppress_st_warning=True)
     def get_insider_transactions(self):
-        url = f"{self.BASE_URL}/stock/{self.symbol}/insider-transactions?token={self.token}"
-        r = requests.get(url)
-
-        return r.json()
-
-def to_excel(df):
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Sheet1')
-    writer.save()
-    processed_data = output.getvalue()
-    return processed_data
-
-def get_table_download_link(df):
-    """Generates a link allowing the data in a given panda dataframe to be downloaded
-    in:  dataframe
-    out: href string
+        return self._get('insider-transactions', f"stock/{self.symbol}/insider-transactions")
+
+    def get_batch(self, types, symbols=None, last=10):
+        """Fetch several data types for many symbols in one request per BATCH_LIMIT symbols.
+        types are endpoint names ('logo', 'quote', 'company', 'news', 'advanced-stats').
+        Returns {symbol: {type: payload}}, each payload shaped like the matching get_* result.
+        """
+        symbols = list(symbols or [self.symbol])
+        urls = {(symbol, t): f"{self.BASE_URL}/{BATCH_PATHS[t].format(symbol=symbol, last=last)}"
+                for symbol in symbols for t in types}
+        batch = {symbol: {} for symbol in symbols}
+        for (symbol, t), url in urls.items():
+            payload = iexclient.lookup(t, symbol, url, {})
+            if payload is not None:
+                batch[symbol][t] = payload
+        missing = [symbol for symbol in symbols if len(batch[symbol]) < len(types)]
+        chunks = [missing[i:i + BATCH_LIMIT] for i in range(0, len(missing), BATCH_LIMIT)]
+        calls = [lambda chunk=chunk: iexclient.fetch_shared('batch', f"{self.BASE_URL}/stock/market/batch",
+                                                            {'symbols': ','.join(chunk), 'types': ','.join(types),
+                                                             'last': last, 'token': self.token})
+                 for chunk in chunks]
+        try:
+            results = iexclient.fetch_all(calls) if len(calls) > 1 else [call() for call in calls]
+        except iexclient.FALLBACK_ERRORS:
+            for (symbol, t), url in urls.items():
+                if t not in batch[symbol]:
+                    payload = iexclient.lookup_stale(t, symbol, url, {})
+                    if payload is None:
+                        raise
+                    batch[symbol][t] = payload
+            return batch
+        for result in results:
+            for symbol in missing:
+                data = result.get(symbol.upper(), result.get(symbol, {}))
+                for t in types:
+                    if t in data:
+                        batch[symbol][t] = iexclient.store(t, symbol, urls[(symbol, t)], {}, data[t])
+        return batch
+
+def download_buttons(sheets, name, key, version=None):
+    """Format picker and download button for {sheet name: DataFrame}.
+    The file is only written once the user asks for it. Given a version (anything that changes
+    whenever the sheets do), the file is kept for the session and offered straight away on later reruns.
     """
-    val = to_excel(df)
-    b64 = base64.b64encode(val)  # val looks like b'...'
-    return f'<a href="data:application/octet-stream;base64,{b64.decode()}" download="extract.xlsx">Download csv file</a>' # decode b'abc' => abc
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox('Format', list(export.FORMATS), key=f'{key}_format', label_visibility='collapsed')
+    with col2:
+        data = memo.session().peek('export', (key, fmt, version)) if version is not None else None
+        if data is None and st.button('Prepare download', key=f'{key}_prepare'):
+            path = export.to_tempfile(sheets, fmt)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            finally:
+                os.remove(path)
+            if version is not None:
+                memo.session().put('export', (key, fmt, version), data)
+        if data is not None:
+            st.download_button(f"Download {export.file_name(name, fmt, sheets)}", data,
+                               file_name=export.file_name(name, fmt, sheets),
+                               mime=export.mime_type(fmt, sheets), key=f'{key}_download')
+
+def show_network_stats(before):
+    """Sidebar summary of upstream requests made during this render and since start-up"""
+    count, seconds = iexclient.latency_stats.totals()
+    with st.sidebar.expander('Network'):
+        st.write(f"This render: {count - before[0]} requests, {seconds - before[1]:.2f}s")
+        st.dataframe(iexclient.latency_stats.to_frame())
+        st.write('Memory cache')
+        st.json(iexclient.memory_cache.stats())
+        st.write('Shared in-flight requests')
+        st.json(iexclient.in_flight.stats())
+        st.write('IEX credits')
+        st.json({**iexclient.budget.stats(), **iexclient.limiter.stats()})
+        st.write('Derived results kept for this session')
+        st.json(memo.session().stats())
+
+def show_prefetch(IEX_TOKEN):
+    """Sidebar control for the background cache warmer, which every session shares"""
+    make_stock = lambda symbol: IEXStock(IEX_TOKEN, symbol)
+    if prefetch.scheduler is None and prefetch.WATCHLIST:
+        prefetch.start(make_stock, prefetch.WATCHLIST)
+    with st.sidebar.expander('Prefetch'):
+        st.text_input('Watchlist', value=' '.join(prefetch.WATCHLIST), key='watchlist',
+                      on_change=lambda: prefetch.start(make_stock, parse_symbols(st.session_state['watchlist'])))
+        if prefetch.scheduler is not None:
+            st.write('Keeping warm:', ' '.join(prefetch.scheduler.watchlist) or 'nothing')
+            st.dataframe(prefetch.scheduler.status())
+
+def show_plan(plan):
+    """Sidebar summary of the upstream calls the current view needs"""
+    with st.sidebar.expander('Fetch plan'):
+        st.write(f"At most {plan.credits():,} credits when nothing is cached")
+        st.dataframe(plan.describe())
+
+def show_live_quotes(IEX_TOKEN, area, symbols):
+    """Keep area showing each symbol's streamed quote until the next rerun, or for LIVE_MINUTES.
+    Runs last: only the placeholders are updated, the rest of the page isn't re-run.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    if 'live_quotes' not in st.session_state:
+        st.session_state['live_quotes'] = streaming.Subscriber()
+    subscriber = st.session_state['live_quotes']
+    with st.sidebar.expander('Live feeds'):
+        st.dataframe(streaming.hub.stats())
+    with area.container():
+        rows = {symbol: st.empty() for symbol in symbols}
+        status = st.empty()
+    for symbol, row in rows.items():
+        row.caption(f'Waiting for {symbol}...')
+    streaming.hub.subscribe(subscriber, [IEXStock(IEX_TOKEN, symbol) for symbol in symbols])
+    shown = {}
+    deadline = time.monotonic() + LIVE_MINUTES * 60
+    try:
+        while time.monotonic() < deadline:
+            for symbol, quote in subscriber.wait(1).items():
+                if symbol in rows:
+                    write_live_quote(rows[symbol], quote, shown.get(symbol))
+                    shown[symbol] = quote
+            # writing something every pass also lets Streamlit stop the loop when an input changes
+            status.caption(f"Live: {subscriber.received:,} updates, {subscriber.conflated:,} skipped, "
+                           f"checked {datetime.now():%H:%M:%S}")
+            time.sleep(LIVE_RENDER_INTERVAL)
+        status.info(f'Live quotes paused after {LIVE_MINUTES:g} minutes; change any input to resume')
+    finally:
+        streaming.hub.unsubscribe(subscriber)
+
+def write_live_quote(placeholder, quote, previous):
+    change = None
+    if previous is not None and None not in (quote.latestPrice, previous.latestPrice):
+        change = round(quote.latestPrice - previous.latestPrice, 2)
+    with placeholder.container():
+        col1, col2, col3, col4 = st.columns(4)
+        col1.subheader(quote.symbol)
+        col2.metric('Price', quote.latestPrice, change)
+        col3.metric('Market Cap', f"{quote.marketCap:,.0f}" if quote.marketCap is not None else 'n/a')
+        col4.metric('P/E', quote.peRatio)
+
+def set_tracing():
+    iexclient.instrumentation.enabled = st.session_state['trace']
+
+
+def show_trace_panel(enabled):
+    """Sidebar debug panel with the most recent endpoint calls and the request metrics"""
+    if not enabled:
+        return
+    with st.sidebar.expander('Request trace', expanded=True):
+        spans = iexclient.instrumentation.to_frame()
+        if spans.empty:
+            st.write('No requests traced yet')
+        else:
+            st.dataframe(spans)
+        st.code(iexclient.instrumentation.prometheus(), language='text')
+        if st.button('Clear trace', key='trace_clear'):
+            iexclient.instrumentation.clear()
+
+# What each view shows; planner.plan turns these into the fewest endpoint calls that provide them
+SCREEN_FIELDS = {
+    'Overview': ['logo.url', 'company.companyName', 'company.industry', 'company.description', 'company.CEO'],
+    'News': ['news'],
+    'Fundamentals': ['advanced-stats.peRatio', 'advanced-stats.forwardPERatio', 'advanced-stats.pegRatio',
+                     'advanced-stats.priceToSales', 'advanced-stats.priceToBook', 'advanced-stats.revenue',
+                     'advanced-stats.totalCash', 'advanced-stats.currentDebt', 'advanced-stats.day200MovingAvg',
+                     'advanced-stats.day50MovingAvg', 'quarters.fiscalQuarter', 'quarters.fiscalYear',
+                     'quarters.filingDate', 'quarters.revenue', 'quarters.incomeNet'],
+    'UT Analysis': ['metrics.evToSales', 'metrics.pToE', 'metrics.netIncome', 'metrics.price', 'metrics.marketCap',
+                    'metrics.enterpriseValue', 'metrics.fiscalYear', 'metrics.revenue', 'metrics.revenueGrowth'],
+    'Comparison Analysis': ['metrics.' + column for column in fundamentals.COMPARISON_COLUMNS],
+    'Screener': ['metrics.' + column for column in fundamentals.SCREENER_COLUMNS],
+    'Chart': ['bars.date', 'bars.close'],
+}
+CHART_INTRADAY_FIELDS = ['intraday-prices.minute', 'intraday-prices.close']  # the Chart view's 1d range
+
+COMPARISON_ROWS = ['Symbol', 'Price', 'EV/ Sales', 'EV/EBITDA', 'Market Cap', 'P/E', 'Gross Margin', 'EBITDA Margin', 'Net Income']
 
 STYLE = """
 <style>
@@ -126,6 +285,12 @@ img {
 
 def main():
 
+    network_before = iexclient.latency_stats.totals()
+    # tracing is process-wide, so this also records other sessions' requests while it's on;
+    # only ticking the box changes it, every session's box shows the current state
+    st.session_state['trace'] = iexclient.instrumentation.enabled
+    tracing = st.sidebar.checkbox('Trace requests', key='trace', on_change=set_tracing)
+    live = st.sidebar.checkbox('Live quotes', value=False, key='live')
     access = 0
     #placeholder1 = st.sidebar.empty()
     #input2 = placeholder1.text_input('API_Key:')
@@ -140,10 +305,10 @@ def main():
             input1.empty()
         st.markdown(STYLE, unsafe_allow_html=True)
         symbol = st.sidebar.text_input("Symbol", value='MSFT')
-        screen = st.sidebar.selectbox("View", ('Overview', 'News', 'Fundamentals', 'UT Analysis', 'Comparison Analysis'), index=0)
+        screen = st.sidebar.selectbox("View", ('Overview', 'News', 'Fundamentals', 'UT Analysis', 'Comparison Analysis', 'Screener', 'Chart'), index=0)
         #IEX_TOKEN = input2
         IEX_TOKEN = ''
-        stock = IEXStock(IEX_TOKEN, symbol)
+        make_stock = lambda s: IEXStock(IEX_TOKEN, s)
         #input2 = placeholder1.text_input('Login Successful', value='', key=1)
         access = 1
         tempSymbol = symbol
@@ -151,57 +316,54 @@ def main():
     if access == 1:
         st.title(screen)
         st.write('Ticker: ', symbol)
+        live_area = st.empty()
+        live_symbols = [symbol]
+        plan = planner.plan(SCREEN_FIELDS[screen], [symbol])
 
         if screen == 'Overview':
 
-            logo = stock.get_logo()
-
-            print("getting company from api, and then storing it in cache")
-            company = stock.get_company_info()
+            batch = plan.run(make_stock).batch[symbol]
+            logo = batch['logo']
+            company = batch['company']
             col1, col2 = st.columns([1, 4])
 
             with col1:
-                st.image(logo['url'])
+                st.image(logo.url)
 
             with col2:
-                st.subheader(company['companyName'])
-                st.write(company['industry'])
+                st.subheader(company.companyName)
+                st.write(company.industry)
                 st.subheader('Description')
-                st.write(company['description'])
+                st.write(company.description)
                 st.subheader('CEO')
-                st.write(company['CEO'])
+                st.write(company.CEO)
 
         if screen == 'News':
 
 
-            news = stock.get_company_news()
+            loading = st.empty()
+            loading.info('Loading news...')
+            news = plan.run(make_stock).batch[symbol]['news']
+            loading.empty()
             for article in news:
-                st.subheader(article['headline'])
-                dt = datetime.utcfromtimestamp(article['datetime'] / 1000).isoformat()
-                st.write(f"Posted by {article['source']} at {dt}")
-                st.write(article['url'])
-                st.write(article['summary'])
-                st.image(article['image'])
+                st.subheader(article.headline)
+                if article.datetime is not None:
+                    dt = datetime.utcfromtimestamp(article.datetime / 1000).isoformat()
+                    st.write(f"Posted by {article.source} at {dt}")
+                st.write(article.url)
+                st.write(article.summary)
+                if article.image:
+                    # the browser fetches the image itself, and only once it scrolls into view
+                    st.markdown(f'<img src="{html.escape(article.image)}" loading="lazy">', unsafe_allow_html=True)
 
 
 
 
         if screen == 'UT Analysis':
 
-            quarter = stock.get_fundamentalsquarterly('quarterly')
-            annual = stock.get_fundamentalsquarterly('annual')
-            annualArrayYear = [len(annual)]
-            annualArrayRevenue = [len(annual)]
-            annualArrayNetIncome = [len(annual)]
-            for annualData in annual:
-                annualArrayYear.append(annualData['fiscalYear'])
-                annualArrayRevenue.append(annualData['revenue'] / 1000000)
-                annualArrayNetIncome.append(annualData['incomeNet'] / 1000000)
-
-
-            quote = stock.get_quote()
-            quoteArrayPE = [len(quote)]
-            PE = quote['peRatio']
+            data = plan.run(make_stock)
+            version = (symbol, timeseries.version([symbol]))
+            metrics = memo.memoize('ut_metrics', version, lambda: data.metrics.loc[symbol])
 
             st.write('')
             st.write('')
@@ -211,7 +373,7 @@ def main():
             with col1_1:
 
 
-                net_income = annualArrayNetIncome[1]
+                net_income = metrics.loc[0, 'netIncome']
                 st.write('Valuation Overview (LFY)')
                 #d = {"": [0, PE, net_income]}
                 #df = pd.DataFrame(d, index=['EV/Sales', 'P/E', 'Net Income'])
@@ -221,41 +383,23 @@ def main():
 
                 st.write('Equity Overview:')
 
-            annual = stock.get_fundamentalsannual1('annual')
-            #st.write(annual)
-
-            annualArrayPE = [len(annual)]
-            annualArrayPrice = [len(annual)]
-            annualArrayMC = [len(annual)]
-            annualArrayEVOS = [len(annual)]
-            annualArrayEV = [len(annual)]
-
-            for x in annual:
-                annualArrayPE.append(round(x['pToE'], 3))
-                annualArrayPrice.append(x['priceAccountingPeriodEnd'])
-                annualArrayMC.append(round(x['marketCapPeriodEnd']/1000000))
-                annualArrayEVOS.append(round(x['evToSales'], 3))
-                annualArrayEV.append(round(x['enterpriseValue'] / 1000000))
-
-
-
             col1_2, col2_2, col3_2, col4_2, col5_2 = st.columns([1, 1, 2, 1, 1])
             with col1_2:
                 st.write('EV/Sales:')
                 st.write('P/E:')
                 st.write('Net Income:')
             with col2_2:
-                st.write(annualArrayEVOS[1])
-                st.write(annualArrayPE[1])
-                st.write(annualArrayNetIncome[1])
+                st.write(metrics.loc[0, 'evToSales'])
+                st.write(metrics.loc[0, 'pToE'])
+                st.write(metrics.loc[0, 'netIncome'])
             with col4_2:
                 st.write('Price:')
                 st.write('M.Cap:')
                 st.write('EV:')
             with col5_2:
-                st.write(annualArrayPrice[1])
-                st.write(annualArrayMC[1])
-                st.write(annualArrayEV[1])
+                st.write(metrics.loc[0, 'price'])
+                st.write(metrics.loc[0, 'marketCap'])
+                st.write(metrics.loc[0, 'enterpriseValue'])
             st.write('')
             st.write('Revenue Growth:')
 
@@ -265,54 +409,39 @@ def main():
                 st.write('Total Revenue:')
                 st.write('Growth:')
             with col2_3:
-                st.write(annualArrayYear[3])
-                st.write(annualArrayRevenue[3])
+                st.write(metrics.loc[2, 'fiscalYear'])
+                st.write(metrics.loc[2, 'revenue'])
 
-                percentChange = (annualArrayRevenue[3] - annualArrayRevenue[4]) / annualArrayRevenue[4]
-                percentChange = percentChange * 100
-                percentChange = round(percentChange, 2)
+                percentChange = metrics.loc[2, 'revenueGrowth']
                 st.write((percentChange), '%')
-                percent3 = str(percentChange) + '%'
 
             with col3_3:
-                st.write(annualArrayYear[2])
-                st.write(annualArrayRevenue[2])
+                st.write(metrics.loc[1, 'fiscalYear'])
+                st.write(metrics.loc[1, 'revenue'])
 
-                percentChange = (annualArrayRevenue[2] - annualArrayRevenue[3]) / annualArrayRevenue[3]
-                percentChange = percentChange * 100
-                percentChange = round(percentChange, 2)
+                percentChange = metrics.loc[1, 'revenueGrowth']
                 st.write((percentChange), '%')
-                percent2 = str(percentChange) + '%'
 
             with col4_3:
-                st.write(annualArrayYear[1])
-                st.write(annualArrayRevenue[1])
+                st.write(metrics.loc[0, 'fiscalYear'])
+                st.write(metrics.loc[0, 'revenue'])
 
-                percentChange = (annualArrayRevenue[1] - annualArrayRevenue[2]) / annualArrayRevenue[2]
-                percentChange = percentChange * 100
-                percentChange = round(percentChange, 2)
+                percentChange = metrics.loc[0, 'revenueGrowth']
                 st.write((percentChange), '%')
-                percent1 = str(percentChange) + '%'
 
             st.write('')
             st.write('')
-            ticker = "Ticker: " + symbol
-            data = [['', '', '', '', '', ''],
-                    ['Key Financial Metrics (in millions)', '', '', '', '',''],
-                    ['', '', '', '', ''],
-                    ['Valuation Overview (LFY)', '', '', '', '',''],
-                    ['EV/Sales:', annualArrayEVOS[1], '','Price:',annualArrayPrice[1]],
-                    ['P/E:', annualArrayPE[1], '', 'M.Cap:', annualArrayMC[1]],
-                    ['Net Income:', annualArrayNetIncome[1], '', 'EV:',annualArrayEV[1]],
-                    ['', '', '', '', '',''],
-                    ['', '', '', '', '',''],
-                    ['Revenue Growth:', '', '', '', '',''],
-                    ['Fiscal Year:', annualArrayYear[3], annualArrayYear[2], annualArrayYear[1], '',''],
-                    ['Total Revenue:', annualArrayRevenue[3], annualArrayRevenue[2], annualArrayRevenue[1], '',''],
-                    ['Growth:', percent3, percent2, percent1, '',''],]
-            df = pd.DataFrame(data, columns=['UT Analysis', ticker, '', '', '', ''], dtype=float)
-            downloadlink = st.empty()
-            downloadlink.markdown(get_table_download_link(df), unsafe_allow_html=True)
+            df = memo.memoize('ut_table', version, lambda: ut_table(symbol, metrics))
+            download_buttons({'UT Analysis': df}, f'{symbol} UT Analysis', key='ut', version=version)
+
+            with st.expander('Full history'):
+                years = metrics['fiscalYear'].dropna().astype(int)
+                if len(years) > 1:
+                    start_year, end_year = st.slider('Fiscal years', int(years.min()), int(years.max()),
+                                                     (int(years.min()), int(years.max())), key='ut_years')
+                    history = memo.memoize('ut_history', (version, start_year, end_year), lambda: timeseries.load(
+                        [symbol], start_year=start_year, end_year=end_year).loc[symbol])
+                    st.dataframe(history.set_index('fiscalYear').drop(columns='fiscalQuarter'))
 
 
                 # colInput1 = st.empty()
@@ -386,212 +515,236 @@ def main():
                     st.write('EBITDA Margin:')
                     st.write('Net Income:')
 
-            with col2_5:
-                symbol0 = getdata(IEX_TOKEN, symbol)
-
-                start = 1
-                dataComp = [['', '', '', '', '', ''],
-                        ['Key Financial Metrics (in millions)', '', '', '', '', ''],
-                        ['Valuation and Margins: (LFY)', '', '', '', ''],
-                        ['', '', '', '', '', ''],
-                        ['Symbol', symbol0[0], '', '', '', ''],
-                        ['Price', symbol0[1], '', '', ''],
-                        ['EV/ Sales', symbol0[2], '', '', ''],
-                        ['EV/EBITDA', symbol0[3], '', '', ''],
-                        ['Market Cap', symbol0[4], '', '', '', ''],
-                        ['P/E', symbol0[5], '', '', '', ''],
-                        ['Gross Margin', symbol0[6], '', '', '', ''],
-                        ['EBITDA Margin', symbol0[7], '', '', '', ''],
-                        ['Net Income', symbol0[8], '', '', '', '']]
-                df = pd.DataFrame(dataComp, columns=['Comparison Analysis', ticker, '', '', '', ''], dtype=float)
-
-            with col3_5:
-                if t1:
-                    symbol1 = getdata(IEX_TOKEN, t1)
-                    dataComp = [['', '', '', '', '', ''],
-                                ['Key Financial Metrics (in millions)', '', '', '', '', ''],
-                                ['Valuation and Margins: (LFY)', '', '', '', ''],
-                                ['', '', '', '', '', ''],
-                                ['Symbol', symbol0[0], symbol1[0], '', '', ''],
-                                ['Price', symbol0[1], symbol1[1], '', ''],
-                                ['EV/ Sales', symbol0[2], symbol1[2], '', ''],
-                                ['EV/EBITDA', symbol0[3], symbol1[3], '', ''],
-                                ['Market Cap', symbol0[4], symbol1[4], '', '', ''],
-                                ['P/E', symbol0[5], symbol1[5], '', '', ''],
-                                ['Gross Margin', symbol0[6], symbol1[6], '', '', ''],
-                                ['EBITDA Margin', symbol0[7], symbol1[7], '', '', ''],
-                                ['Net Income', symbol0[8], symbol1[8], '', '', '']]
-                    df = pd.DataFrame(dataComp, columns=['Comparison Analysis', ticker, '', '', '', ''], dtype=float)
-
-
-            with col4_5:
-                if t2:
-                    symbol2 = getdata(IEX_TOKEN, t2)
-                    dataComp = [['', '', '', '', '', ''],
-                                ['Key Financial Metrics (in millions)', '', '', '', '', ''],
-                                ['Valuation and Margins: (LFY)', '', '', '', ''],
-                                ['', '', '', '', '', ''],
-                                ['Symbol', symbol0[0], symbol1[0], symbol2[0], '', ''],
-                                ['Price', symbol0[1], symbol1[1], symbol2[1], ''],
-                                ['EV/ Sales', symbol0[2], symbol1[2], symbol2[2], ''],
-                                ['EV/EBITDA', symbol0[3], symbol1[3], symbol2[3], ''],
-                                ['Market Cap', symbol0[4], symbol1[4], symbol2[4], '', ''],
-                                ['P/E', symbol0[5], symbol1[5], symbol2[5], '', ''],
-                                ['Gross Margin', symbol0[6], symbol1[6], symbol2[6], '', ''],
-                                ['EBITDA Margin', symbol0[7], symbol1[7], symbol2[7], '', ''],
-                                ['Net Income', symbol0[8], symbol1[8], symbol2[8], '', '']]
-                    df = pd.DataFrame(dataComp, columns=['Comparison Analysis', ticker, '', '', '', ''], dtype=float)
-
-            with col5_5:
-                if t3:
-                    symbol3 = getdata(IEX_TOKEN, t3)
-                    dataComp = [['', '', '', '', '', ''],
-                                ['Key Financial Metrics (in millions)', '', '', '', '', ''],
-                                ['Valuation and Margins: (LFY)', '', '', '', ''],
-                                ['', '', '', '', '', ''],
-                                ['Symbol', symbol0[0], symbol1[0], symbol2[0], symbol3[0], ''],
-                                ['Price', symbol0[1], symbol1[1], symbol2[1], symbol3[1]],
-                                ['EV/ Sales', symbol0[2], symbol1[2], symbol2[2], symbol3[2]],
-                                ['EV/EBITDA', symbol0[3], symbol1[3], symbol2[3], symbol3[3]],
-                                ['Market Cap', symbol0[4], symbol1[4], symbol2[4], symbol3[4], ''],
-                                ['P/E', symbol0[5], symbol1[5], symbol2[5], symbol3[5], ''],
-                                ['Gross Margin', symbol0[6], symbol1[6], symbol2[6], symbol3[6], ''],
-                                ['EBITDA Margin', symbol0[7], symbol1[7], symbol2[7], symbol3[7], ''],
-                                ['Net Income', symbol0[8], symbol1[8], symbol2[8], symbol3[8], '']]
-                    df = pd.DataFrame(dataComp, columns=['Comparison Analysis', ticker, '', '', '', ''], dtype=float)
-
-            downloadlink = st.empty()
-            downloadlink.markdown(get_table_download_link(df), unsafe_allow_html=True)
-
-
-
-
-
+            slots = [symbol, t1, t2, t3]
+            tickers = [t for t in slots if t]
+            live_symbols = tickers
+            plan = planner.plan(SCREEN_FIELDS[screen], tickers)
+            placeholders = {}
+            for col, t in zip([col2_5, col3_5, col4_5, col5_5], slots):
+                if t:
+                    placeholder = col.empty()
+                    placeholder.caption(f'Loading {t}...')
+                    placeholders.setdefault(t, []).append(placeholder)
+            start = 1
+            columns = {}
+            for t, data in iter_getdata(IEX_TOKEN, tickers):
+                columns[t] = data
+                for placeholder in placeholders[t]:
+                    with placeholder.container():
+                        write_comparison_column(data)
+            version = (tuple(tickers), timeseries.version(tickers))
+            df = memo.memoize('comparison_table', version, lambda: pd.DataFrame(
+                comparison_table([columns[t] for t in tickers]), columns=['Comparison Analysis', ticker, '', '', '', ''], dtype=float))
+
+            download_buttons({'Comparison Analysis': df}, f'{symbol} Comparison Analysis', key='comparison', version=version)
+
+
+
+
+
+
+        if screen == 'Screener':
+
+            text = st.text_area('Symbols (separated by spaces, commas or new lines)', value=symbol)
+            upload = st.file_uploader('Or upload a CSV whose first column holds the symbols', type='csv')
+            symbols = parse_symbols(text)
+            if upload is not None:
+                symbols = parse_symbols(' '.join(pd.read_csv(upload).iloc[:, 0].astype(str)))
+
+            live_symbols = []  # one stream per symbol is too many for a screen
+            plan = planner.plan(SCREEN_FIELDS[screen], symbols)
+            latest, failed, version = get_screener_metrics(IEX_TOKEN, symbols)
+            if failed:
+                st.warning(f"No data for {len(failed)} symbols: {', '.join(failed)}")
+
+            col1_6, col2_6 = st.columns(2)
+            with col1_6:
+                sort_by = st.selectbox('Sort by', fundamentals.SCREENER_COLUMNS)
+            with col2_6:
+                ascending = st.checkbox('Ascending', value=True)
+            ranges = {}
+            with st.expander('Filters'):
+                for column in fundamentals.SCREENER_COLUMNS[:5]:
+                    col1_7, col2_7 = st.columns(2)
+                    low = parse_bound(col1_7.text_input(f'{column} min', key=f'{column}_min'))
+                    high = parse_bound(col2_7.text_input(f'{column} max', key=f'{column}_max'))
+                    if low is not None or high is not None:
+                        ranges[column] = (low, high)
+
+            version = (version, sort_by, ascending, tuple(sorted(ranges.items())))
+            df = memo.memoize('screener', version, lambda: fundamentals.screen(latest, sort_by, ascending, ranges))
+            st.write(f"{len(df)} of {len(latest)} symbols")
+            st.dataframe(df)
+            download_buttons({'Screener': df.reset_index()}, 'Screener', key='screener', version=version)
+
+        if screen == 'Chart':
+
+            col1_8, col2_8 = st.columns([3, 1])
+            with col1_8:
+                compare = parse_symbols(st.text_input('Compare with (symbols separated by spaces)', value='', key='chart_compare'))
+            with col2_8:
+                chart_range = st.selectbox('Range', list(prices.RANGES), index=list(prices.RANGES).index('1y'), key='chart_range')
+            symbols = list(dict.fromkeys([symbol.upper()] + compare))
+            live_symbols = symbols
+            col1_9, col2_9, col3_9 = st.columns(3)
+            with col1_9:
+                windows = st.multiselect('Moving averages (bars)', [20, 50, 200], default=[50], key='chart_windows')
+            with col2_9:
+                method = st.selectbox('Downsampling', prices.DOWNSAMPLERS, key='chart_method')
+            with col3_9:
+                relative = st.checkbox('Show as % return', value=len(symbols) > 1, key='chart_relative')
+
+            if chart_range == '1d':
+                plan = planner.plan(CHART_INTRADAY_FIELDS, symbols)
+                batch = plan.run(make_stock).batch
+                closes = prices.intraday({s: batch[s].get('intraday-prices') for s in symbols})
+                lines = prices.chart_lines(closes, windows, relative)
+                points = prices.downsample(lines, method=method)
+                periods, version = prices.INTRADAY_PERIODS, None  # not worth keeping: it changes every minute
+            else:
+                plan = planner.plan(SCREEN_FIELDS[screen], symbols)
+                failed = plan.run(make_stock, return_exceptions=True).failed
+                if failed:
+                    st.warning(f"No prices for {', '.join(failed)}")
+                symbols = [s for s in symbols if s not in failed]
+                version = (tuple(symbols), prices.version(symbols))
+                history = memo.memoize('chart_history', version, lambda: prices.closes(symbols, 'max'))
+                closes = memo.memoize('chart_closes', (version, chart_range), lambda: prices.closes(symbols, chart_range))
+                key = (version, chart_range, tuple(windows), relative)
+                lines = memo.memoize('chart_lines', key, lambda: prices.chart_lines(closes, windows, relative, history))
+                points = memo.memoize('chart_points', (key, method), lambda: prices.downsample(lines, method=method))
+                periods, version = prices.TRADING_DAYS, (version, chart_range)
+
+            if closes.empty:
+                st.warning(f"No prices for {', '.join(symbols)}")
+            else:
+                st.line_chart(points, x='time', y='value', color='line')
+                st.caption(f"{len(points):,} of {int(lines.count().sum()):,} points drawn")
+                st.dataframe(prices.summary(closes, periods))
+                download_buttons({'Prices': closes.reset_index()}, f"{' '.join(symbols)} {chart_range} prices", key='chart',
+                                 version=version)
 
         if screen == 'Fundamentals':
 
-            stats = stock.get_stats()
+            data = plan.run(make_stock)
+            stats = data.batch[symbol]['advanced-stats']
             st.header('Ratios')
             col1, col2 = st.columns(2)
 
             with col1:
                 st.subheader('P/E')
-                st.write(stats['peRatio'])
+                st.write(stats.peRatio)
                 st.subheader('Forward P/E')
-                st.write(stats['forwardPERatio'])
+                st.write(stats.forwardPERatio)
                 st.subheader('PEG Ratio')
-                st.write(stats['pegRatio'])
+                st.write(stats.pegRatio)
                 st.subheader('Price to Sales')
-                st.write(stats['priceToSales'])
+                st.write(stats.priceToSales)
                 st.subheader('Price to Book')
-                st.write(stats['priceToBook'])
+                st.write(stats.priceToBook)
             with col2:
                 st.subheader('Revenue')
-                st.write(format_number(stats['revenue']))
+                st.write(format_number(stats.revenue))
                 st.subheader('Cash')
-                st.write(format_number(stats['totalCash']))
+                st.write(format_number(stats.totalCash))
                 st.subheader('Debt')
-                st.write(format_number(stats['currentDebt']))
+                st.write(format_number(stats.currentDebt))
                 st.subheader('200 Day Moving Average')
-                st.write(stats['day200MovingAvg'])
+                st.write(stats.day200MovingAvg)
                 st.subheader('50 Day Moving Average')
-                st.write(stats['day50MovingAvg'])
+                st.write(stats.day50MovingAvg)
 
-            fundamentals = stock.get_fundamentalsquarterly('quarterly')
-            for quarter in fundamentals:
-                st.header(f"Q{quarter['fiscalQuarter']} {quarter['fiscalYear']}")
+            quarters = data.quarters[symbol]
+            for quarter in quarters:
+                st.header(f"Q{quarter.fiscalQuarter} {quarter.fiscalYear}")
                 st.subheader('Filing Date')
-                st.write(quarter['filingDate'])
+                st.write(quarter.filingDate)
                 st.subheader('Revenue')
-                st.write(format_number(quarter['revenue']))
+                st.write(format_number(quarter.revenue))
                 st.subheader('Net Income')
-                st.write(format_number(quarter['incomeNet']))
-
-
-def getdata(stock):
-    quarter = stock.get_fundamentalsquarterly('quarterly')
-    annual = stock.get_fundamentalsquarterly('annual')
-    annualArrayYear = [len(annual)]
-    annualArrayRevenue = [len(annual)]
-    annualArrayNetIncome = [len(annual)]
-    for annualData in annual:
-        annualArrayYear.append(annualData['fiscalYear'])
-        annualArrayRevenue.append(annualData['revenue'] / 1000000)
-        annualArrayNetIncome.append(annualData['incomeNet'] / 1000000)
-
-    quote = stock.get_quote()
-    quoteArrayPE = [len(quote)]
-    PE = quote['peRatio']
-
-    annual = stock.get_fundamentalsannual1('annual')
-    # st.write(annual)
-
-    annualArrayPE = [len(annual)]
-    annualArrayPrice = [len(annual)]
-    annualArrayMC = [len(annual)]
-    annualArrayEVOS = [len(annual)]
-    annualArrayEV = [len(annual)]
-
-    for x in annual:
-        annualArrayPE.append(round(x['pToE'], 3))
-        annualArrayPrice.append(x['priceAccountingPeriodEnd'])
-        annualArrayMC.append(round(x['marketCapPeriodEnd'] / 1000000))
-        annualArrayEVOS.append(round(x['evToSales'], 3))
-        annualArrayEV.append(round(x['enterpriseValue'] / 1000000))
-
-def getdata(IEX_TOKEN, stock1):
-    ticker = stock1
-    stock1 = IEXStock(IEX_TOKEN, stock1)
-    quarter1 = stock1.get_fundamentalsquarterly('quarterly')
-    annual1 = stock1.get_fundamentalsquarterly('annual')
-
-    annualArrayYear1 = [len(annual1)]
-    annualArrayRevenue1 = [len(annual1)]
-    annualArrayNetIncome1 = [len(annual1)]
-    annualArrayGrossmargin1 = [len(annual1)]
-
-
-    for annualData1 in annual1:
-        annualArrayYear1.append(annualData1['fiscalYear'])
-        annualArrayRevenue1.append(annualData1['revenue'] / 1000000)
-        annualArrayNetIncome1.append(annualData1['incomeNet'] / 1000000)
-        annualArrayGrossmargin1.append(round(annualData1['profitGrossPerRevenue'],4))
-
-    quote1 = stock1.get_quote()
-    quoteArrayPE1 = [len(quote1)]
-    PE1 = quote1['peRatio']
-
-    annual1 = stock1.get_fundamentalsannual1('annual')
-    # st.write(annual)
-
-    annualArrayPE1 = [len(annual1)]
-    annualArrayPrice1 = [len(annual1)]
-    annualArrayEBITDA1 = [len(annual1)]
-    annualArrayMC1 = [len(annual1)]
-    annualArrayEVOS1 = [len(annual1)]
-    annualArrayEV1 = [len(annual1)]
-    annualArrayEBITDAMargin1 = [len(annual1)]
-
-    for x1 in annual1:
-        annualArrayPE1.append(round(x1['pToE'], 3))
-        annualArrayPrice1.append(x1['priceAccountingPeriodEnd'])
-        annualArrayMC1.append(round(x1['marketCapPeriodEnd'] / 1000000))
-        annualArrayEVOS1.append(round(x1['evToSales'], 3))
-        annualArrayEV1.append(round(x1['enterpriseValue'] / 1000000))
-        annualArrayEBITDA1.append(round(x1['evToEbitda'], 4))
-        annualArrayEBITDAMargin1.append(round(x1['ebitdaMargin'], 4))
-    st.write(ticker)
-    st.write(annualArrayPrice1[1])
-    st.write(annualArrayEVOS1[1])
-    st.write(annualArrayEBITDA1[1])
-    st.write(annualArrayMC1[1])
-    st.write(annualArrayPE1[1])
-    st.write(annualArrayGrossmargin1[1])
-    st.write(annualArrayEBITDAMargin1[1])
-    st.write(annualArrayNetIncome1[1])
-
-    data = [ticker,annualArrayPrice1[1],annualArrayEVOS1[1], annualArrayEBITDA1[1], annualArrayMC1[1], annualArrayPE1[1], annualArrayGrossmargin1[1], annualArrayNetIncome1[1], annualArrayNetIncome1[1]]
-    return data
+                st.write(format_number(quarter.incomeNet))
+
+        show_plan(plan)
+        show_prefetch(IEX_TOKEN)
+        show_network_stats(network_before)
+        show_trace_panel(tracing)
+        if live and live_symbols:
+            show_live_quotes(IEX_TOKEN, live_area, live_symbols)
+
+
+def iter_getdata(IEX_TOKEN, tickers):
+    """Yield (ticker, comparison column) for each ticker as soon as its own requests complete.
+    Every upstream request is issued up front, so the slowest ticker doesn't hold back the others.
+    """
+    make_stock = lambda s: IEXStock(IEX_TOKEN, s)
+    pending = {}
+    for ticker in dict.fromkeys(tickers):
+        tasks = planner.plan(SCREEN_FIELDS['Comparison Analysis'], [ticker]).tasks(make_stock)
+        pending[ticker] = [iexclient.executor.submit(task.run) for task in tasks]
+    owners = {future: ticker for ticker, futures in pending.items() for future in futures}
+    for future in as_completed(owners):
+        ticker = owners[future]
+        if ticker in pending and all(f.done() for f in pending[ticker]):
+            for f in pending.pop(ticker):
+                f.result()
+            yield ticker, memo.memoize('comparison_column', (ticker, timeseries.version([ticker])),
+                                       lambda: comparison_column(ticker))
+
+def comparison_column(ticker):
+    latest = fundamentals.latest(timeseries.load([ticker]))
+    return [ticker] + latest.loc[ticker, fundamentals.COMPARISON_COLUMNS].tolist()
+
+def get_screener_metrics(IEX_TOKEN, symbols):
+    """Latest annual metrics for every symbol, with all requests issued concurrently.
+    Returns the metrics frame, the symbols whose requests failed and a version for keying what's derived from it.
+    """
+    result = planner.plan(SCREEN_FIELDS['Screener'], symbols).run(lambda s: IEXStock(IEX_TOKEN, s), return_exceptions=True)
+    version = (tuple(result.stored), timeseries.version(result.stored))
+    latest = memo.memoize('screener_latest', version, lambda: fundamentals.latest(result.metrics))
+    return latest, [symbol for symbol in symbols if symbol in result.failed], version
+
+def parse_symbols(text):
+    symbols = [s for s in re.split(r'[\s,;]+', text.upper()) if s]
+    return list(dict.fromkeys(symbols))
+
+def parse_bound(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def write_comparison_column(data):
+    for value in data:
+        st.write(value)
+
+def ut_table(symbol, metrics):
+    """The UT Analysis export sheet from one symbol's metrics (indexed by period, 0 = latest)"""
+    percent = {i: str(metrics.loc[i, 'revenueGrowth']) + '%' for i in range(3)}
+    ticker = "Ticker: " + symbol
+    data = [['', '', '', '', '', ''],
+            ['Key Financial Metrics (in millions)', '', '', '', '',''],
+            ['', '', '', '', ''],
+            ['Valuation Overview (LFY)', '', '', '', '',''],
+            ['EV/Sales:', metrics.loc[0, 'evToSales'], '','Price:',metrics.loc[0, 'price']],
+            ['P/E:', metrics.loc[0, 'pToE'], '', 'M.Cap:', metrics.loc[0, 'marketCap']],
+            ['Net Income:', metrics.loc[0, 'netIncome'], '', 'EV:',metrics.loc[0, 'enterpriseValue']],
+            ['', '', '', '', '',''],
+            ['', '', '', '', '',''],
+            ['Revenue Growth:', '', '', '', '',''],
+            ['Fiscal Year:', metrics.loc[2, 'fiscalYear'], metrics.loc[1, 'fiscalYear'], metrics.loc[0, 'fiscalYear'], '',''],
+            ['Total Revenue:', metrics.loc[2, 'revenue'], metrics.loc[1, 'revenue'], metrics.loc[0, 'revenue'], '',''],
+            ['Growth:', percent[2], percent[1], percent[0], '',''],]
+    return pd.DataFrame(data, columns=['UT Analysis', ticker, '', '', '', ''], dtype=float)
+
+def comparison_table(columns):
+    dataComp = [['', '', '', '', '', ''],
+                ['Key Financial Metrics (in millions)', '', '', '', '', ''],
+                ['Valuation and Margins: (LFY)', '', '', '', ''],
+                ['', '', '', '', '', '']]
+    for i, label in enumerate(COMPARISON_ROWS):
+        row = [label] + [data[i] for data in columns]
+        dataComp.append(row + [''] * (6 - len(row)))
+    return dataComp
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
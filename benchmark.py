@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+# Page-render benchmarks. Each scenario drives main() headlessly through
+# Streamlit's AppTest against a local mockiex server, so results don't depend
+# on the real API or on spending credits:
+#   python benchmark.py --runs 20 --latency 0.05
+#   python benchmark.py --fixtures fixtures/ --compare
+#   python benchmark.py --decode         (JSON decoding per endpoint and backend only)
+# Every run is appended to --results; --compare reports changes against the previous run.
+
+_scratch = tempfile.mkdtemp(prefix='stockdata-bench-')
+os.environ.setdefault('IEX_CACHE_PATH', os.path.join(_scratch, 'iex.sqlite'))
+os.environ.setdefault('IEX_STORE_PATH', os.path.join(_scratch, 'timeseries'))
+
+import codec  # noqa: E402
+import iexclient  # noqa: E402  (reads IEX_CACHE_PATH and IEX_STORE_PATH at import)
+import mockiex  # noqa: E402
+import timeseries  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Stockdata.py')
+SCREENS = ['Overview', 'News', 'Fundamentals', 'UT Analysis']
+COMPARISON_TICKERS = ['AAPL', 'AMZN', 'GOOG']
+COMPARISON_KEYS = ['2', '3', '4']  # keys of the three 'Add Ticker' inputs
+CHART_RANGES = ['1y', 'max']
+CHART_COMPARE = ['AAPL', 'AMZN']
+REGRESSION = 0.2  # relative p50 slowdown reported as a regression
+
+
+def scenarios(screener_size):
+    for screen in SCREENS:
+        yield screen, {'screen': screen}
+    for n in range(1, 5):
+        yield f"Comparison Analysis x{n}", {'screen': 'Comparison Analysis', 'tickers': COMPARISON_TICKERS[:n - 1]}
+    for chart_range in CHART_RANGES:
+        yield f"Chart {chart_range}", {'screen': 'Chart', 'range': chart_range}
+    yield f"Chart max x{len(CHART_COMPARE) + 1}", {'screen': 'Chart', 'range': 'max', 'compare': CHART_COMPARE}
+    if screener_size:
+        symbols = [f"SYM{i}" for i in range(screener_size)]
+        yield f"Screener x{screener_size}", {'screen': 'Screener', 'symbols': symbols}
+
+
+def clear_caches():
+    iexclient.memory_cache.clear()
+    iexclient.disk_cache.clear()
+    shutil.rmtree(timeseries.store.path, ignore_errors=True)
+
+
+def prepare(scenario, timeout):
+    """An AppTest with the scenario's widgets set, ready for the measured run"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.run()
+    at.sidebar.selectbox[0].select(scenario['screen']).run()
+    for key, ticker in zip(COMPARISON_KEYS, scenario.get('tickers', [])):
+        at.text_input(key=key).input(ticker)
+    if scenario.get('symbols') is not None:
+        at.text_area[0].input(' '.join(scenario['symbols']))
+    if scenario.get('range') is not None:
+        at.selectbox(key='chart_range').select(scenario['range'])
+    if scenario.get('compare'):
+        at.text_input(key='chart_compare').input(' '.join(scenario['compare']))
+    return at
+
+
+def measure(server, scenario, cold, timeout, trace=False):
+    at = prepare(scenario, timeout)
+    if cold:
+        clear_caches()
+    else:
+        at.run()
+    requests_before = server.requests
+    network_before = iexclient.latency_stats.totals()[1]
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if at.exception:
+        raise RuntimeError(f"{scenario['screen']} raised: {at.exception[0].value}")
+    return {'seconds': elapsed, 'requests': server.requests - requests_before,
+            'network': iexclient.latency_stats.totals()[1] - network_before, 'peak': peak}
+
+
+def run(args):
+    server = mockiex.start(mode='replay' if args.fixtures else 'synthetic', fixtures=args.fixtures,
+                           latency=args.latency, jitter=args.jitter, seed=0)
+    os.environ['IEX_ENVIRONMENT'] = server.base_url
+    results = {}
+    for name, scenario in scenarios(args.screener_size):
+        if args.only and not any(part.lower() in name.lower() for part in args.only):
+            continue
+        samples = [measure(server, scenario, args.cold, args.timeout) for _ in range(args.runs)]
+        # tracemalloc slows everything down, so peak memory gets its own run
+        traced = measure(server, scenario, args.cold, args.timeout, trace=True)
+        seconds = [sample['seconds'] for sample in samples]
+        results[name] = {
+            'p50': float(np.percentile(seconds, 50)),
+            'p95': float(np.percentile(seconds, 95)),
+            'network': float(np.mean([sample['network'] for sample in samples])),
+            'requests': float(np.mean([sample['requests'] for sample in samples])),
+            'peak_mb': traced['peak'] / 1e6,
+        }
+        print(format_row(name, results[name]), flush=True)
+    server.shutdown()
+    return results
+
+
+def format_row(name, result):
+    return (f"{name:<28} p50 {result['p50'] * 1000:8.1f}ms  p95 {result['p95'] * 1000:8.1f}ms  "
+            f"network {result['network'] * 1000:8.1f}ms  requests {result['requests']:6.1f}  peak {result['peak_mb']:7.1f}MB")
+
+
+def decode_bodies(last):
+    """(endpoint, body) pairs shaped like the real responses, with last periods/articles per series"""
+    symbols = [f"SYM{i}" for i in range(100)]
+    routes = [
+        ('quote', '/stock/AAPL/quote', {}),
+        ('advanced-stats', '/stock/AAPL/advanced-stats', {}),
+        ('news', f"/stock/AAPL/news/last/{last}", {}),
+        ('time-series/fundamentals', '/time-series/fundamentals/AAPL/quarterly', {'last': str(last)}),
+        ('time-series/FUNDAMENTAL_VALUATIONS', '/time-series/FUNDAMENTAL_VALUATIONS/AAPL/quarterly', {'last': str(last)}),
+        ('batch', '/stock/market/batch', {'symbols': ','.join(symbols), 'types': 'logo,company,quote'}),
+    ]
+    return [(endpoint, json.dumps(mockiex.synthetic(path, query)).encode()) for endpoint, path, query in routes]
+
+
+def decode_benchmark(args):
+    """Time codec.decode per endpoint for every installed backend"""
+    print(f"{'endpoint':<36}{'KB':>8}" + ''.join(f"{backend:>12}" for backend in codec.AVAILABLE) + '   (us per body)')
+    for endpoint, body in decode_bodies(args.decode_last):
+        times = {}
+        for backend in codec.AVAILABLE:
+            codec.decode(endpoint, body, backend)
+            n = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < 0.2:
+                codec.decode(endpoint, body, backend)
+                n += 1
+            times[backend] = (time.perf_counter() - start) / n
+        speedup = times['json'] / min(times.values())
+        print(f"{endpoint:<36}{len(body) / 1000:8.1f}" + ''.join(f"{times[b] * 1e6:12.1f}" for b in codec.AVAILABLE)
+              + f"   {speedup:.1f}x")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_runs(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(previous, current):
+    """Print p50 changes against a previous run; returns the names of scenarios that regressed"""
+    regressed = []
+    print(f"\nCompared with {previous['label'] or previous['revision']} ({previous['time']}):")
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if not before:
+            continue
+        change = result['p50'] / before['p50'] - 1 if before['p50'] else 0.0
+        flag = ''
+        if change > REGRESSION:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print(f"{name:<28} p50 {before['p50'] * 1000:8.1f}ms -> {result['p50'] * 1000:8.1f}ms ({change:+.0%})  "
+              f"requests {before['requests']:.1f} -> {result['requests']:.1f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark page renders against a local mock IEX API')
+    parser.add_argument('--runs', type=int, default=10, help='measured renders per scenario')
+    parser.add_argument('--cold', action='store_true', help='clear the response caches before every render')
+    parser.add_argument('--fixtures', help='replay recorded responses from this directory')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--screener-size', type=int, default=100, help='symbols in the screener scenario, 0 to skip')
+    parser.add_argument('--only', nargs='*', help='run scenarios whose name contains any of these')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--results', default='benchmark_results.jsonl', help='file runs are appended to')
+    parser.add_argument('--label', help='name for this run')
+    parser.add_argument('--compare', action='store_true', help='compare with the previous stored run')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--decode', action='store_true', help='only benchmark JSON decoding per endpoint')
+    parser.add_argument('--decode-last', type=int, default=40, help='periods/articles in the decoded series')
+    args = parser.parse_args()
+    if args.decode:
+        decode_benchmark(args)
+        return
+    warnings.simplefilter('ignore', FutureWarning)  # pandas deprecation noise from every render
+
+    current = {'time': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(), 'label': args.label,
+               'settings': {'runs': args.runs, 'cold': args.cold, 'latency': args.latency, 'jitter': args.jitter,
+                            'fixtures': args.fixtures, 'screener_size': args.screener_size},
+               'results': run(args)}
+    previous = load_runs(args.results)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(current) + '\n')
+    regressed = []
+    if args.compare and previous:
+        regressed = compare(previous[-1], current)
+    if regressed and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import json
+import os
+from typing import Any, List, Optional, Union
+
+import records
+
+# JSON decoding and encoding for IEX bodies and the disk cache, with the
+# fastest library installed:
+#   msgspec  decodes modelled endpoints straight into record fields, without
+#            building dicts for the fields records.py doesn't keep
+#   orjson   faster json.loads/json.dumps
+#   json     the stdlib fallback
+# Both libraries are optional. IEX_JSON=orjson or IEX_JSON=json picks a slower
+# backend, e.g. to compare.
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AVAILABLE = ['json'] + (['orjson'] if orjson else []) + (['msgspec'] if msgspec else [])
+BACKEND = os.environ.get('IEX_JSON') or AVAILABLE[-1]
+if BACKEND not in AVAILABLE:
+    raise ImportError(f"IEX_JSON={BACKEND} but {BACKEND} is not installed")
+
+
+def loads(body, backend=None):
+    if (backend or BACKEND) != 'json' and orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(payload):
+    if BACKEND != 'json' and orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload)
+
+
+_decoders = {}
+
+
+def _decoder(model):
+    # a struct with only the record's fields, so everything else in the body is skipped, not built
+    decoder = _decoders.get(model)
+    if decoder is None:
+        struct = msgspec.defstruct(f"{model.__name__}Struct", [(name, Any, None) for name in model.FIELDS])
+        decoder = _decoders[model] = msgspec.json.Decoder(Optional[Union[List[Optional[struct]], struct]])
+    return decoder
+
+
+def decode(endpoint, body, backend=None):
+    """A response body (bytes or str) decoded to what records.parse(endpoint, ...) returns"""
+    backend = backend or BACKEND
+    model = records.MODELS.get(endpoint)
+    if backend == 'msgspec' and model is not None:
+        payload = _decoder(model).decode(body)
+        if isinstance(payload, list):
+            return [model.from_object(row) for row in payload if row is not None]
+        return model.from_object(payload) if payload is not None else None
+    return records.parse(endpoint, loads(body, backend))
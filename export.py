@@ -0,0 +1,92 @@
+import os
+import re
+import tempfile
+import zipfile
+
+import xlsxwriter
+
+# File exports for the tables the app shows. Sheets are {sheet name: DataFrame};
+# output is streamed to a file so large workbooks never sit in memory whole.
+
+CHUNK_ROWS = 10000
+FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def write(sheets, fmt, path):
+    """Write sheets to path. csv and parquet hold one table per file, so several sheets go into a zip."""
+    if fmt == 'xlsx':
+        write_excel(sheets, path)
+    elif len(sheets) == 1:
+        _write_table(next(iter(sheets.values())), fmt, path)
+    else:
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, df in sheets.items():
+                with archive.open(f"{_safe_name(name)}.{fmt}", 'w') as f:
+                    _write_table(df, fmt, f)
+
+
+def file_name(name, fmt, sheets):
+    extension = fmt if fmt == 'xlsx' or len(sheets) == 1 else 'zip'
+    return f"{name}.{extension}"
+
+
+def mime_type(fmt, sheets):
+    return FORMATS[fmt] if fmt == 'xlsx' or len(sheets) == 1 else 'application/zip'
+
+
+def to_tempfile(sheets, fmt):
+    """Write sheets to a new temporary file and return its path; the caller removes it"""
+    fd, path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(fd)
+    try:
+        write(sheets, fmt, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def write_excel(sheets, path):
+    # constant_memory flushes each row to disk once the next one starts, so rows must go in order
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+    try:
+        for name, df in sheets.items():
+            worksheet = workbook.add_worksheet(_safe_name(name)[:31])
+            worksheet.write_row(0, 0, [str(column) for column in df.columns])
+            for start in range(0, len(df), CHUNK_ROWS):
+                for row, values in enumerate(_cells(df.iloc[start:start + CHUNK_ROWS]), start=start + 1):
+                    worksheet.write_row(row, 0, values)
+    finally:
+        workbook.close()
+
+
+def _write_table(df, fmt, target):
+    if fmt == 'csv':
+        df.to_csv(target, index=False, chunksize=CHUNK_ROWS)
+    elif fmt == 'parquet':
+        _columnar(df).to_parquet(target, index=False)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def _columnar(df):
+    # parquet needs unique column names and a single type per column
+    df = df.copy()
+    df.columns = [column if column and list(df.columns).count(column) == 1 else f"{column or 'column'}_{i}"
+                  for i, column in enumerate(df.columns)]
+    mixed = [column for column in df.columns if df[column].dtype == object]
+    return df.astype({column: str for column in mixed})
+
+
+def _cells(chunk):
+    """Rows of plain Python values with missing values as None, which xlsxwriter leaves blank"""
+    values = chunk.astype(object)
+    return values.where(chunk.notna(), None).to_numpy().tolist()
+
+
+def _safe_name(name):
+    return re.sub(r'[\[\]:*?/\\]', '_', str(name)) or 'Sheet1'
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+import records
+
+# Columnar view of the IEX time-series/fundamentals and FUNDAMENTAL_VALUATIONS
+# responses. Everything is computed per column across all symbols and periods
+# at once; period 0 is the most recent one, as returned by IEX.
+
+MILLION = 1000000
+
+FUNDAMENTALS_COLUMNS = {
+    'fiscalYear': 'Int64',
+    'fiscalQuarter': 'Int64',
+    'filingDate': 'object',
+    'revenue': 'float64',
+    'incomeNet': 'float64',
+    'profitGrossPerRevenue': 'float64',
+}
+
+VALUATIONS_COLUMNS = {
+    'pToE': 'float64',
+    'priceAccountingPeriodEnd': 'float64',
+    'marketCapPeriodEnd': 'float64',
+    'evToSales': 'float64',
+    'enterpriseValue': 'float64',
+    'evToEbitda': 'float64',
+    'ebitdaMargin': 'float64',
+}
+
+# Metric columns in the order of the Comparison Analysis rows after 'Symbol'
+COMPARISON_COLUMNS = ['price', 'evToSales', 'evToEbitda', 'marketCap', 'pToE', 'grossMargin', 'ebitdaMargin', 'netIncome']
+
+# Metrics the screener ranks on, followed by the ones it only displays
+SCREENER_COLUMNS = ['evToSales', 'evToEbitda', 'pToE', 'grossMargin', 'ebitdaMargin',
+                    'price', 'marketCap', 'enterpriseValue', 'revenue', 'revenueGrowth', 'netIncome', 'fiscalYear']
+
+
+def to_frame(payloads, columns):
+    """Stack {symbol: time-series response} into one typed frame indexed by (symbol, period).
+    Rows may be records or raw dicts.
+    """
+    payloads = {symbol: payload or [] for symbol, payload in payloads.items()}
+    lengths = np.array([len(payload) for payload in payloads.values()], dtype=np.int64)
+    rows = [row for payload in payloads.values() for row in payload]
+    df = pd.DataFrame(records.columns(rows, columns), columns=list(columns)).astype(columns)
+    symbols = np.repeat(np.array(list(payloads), dtype=object), lengths)
+    periods = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    df.index = pd.MultiIndex.from_arrays([symbols, periods], names=['symbol', 'period'])
+    return df
+
+
+def build_metrics(fundamentals, valuations):
+    """Scaled values, margins, growth and multiples for every (symbol, period).
+
+    fundamentals and valuations are frames from to_frame, matched by position
+    within each symbol. Missing inputs give NaN rather than an error.
+    """
+    df = fundamentals.join(valuations, how='outer')
+    revenue = df['revenue'] / MILLION
+    previous = revenue.groupby(level='symbol').shift(-1)
+    metrics = pd.DataFrame({
+        'fiscalYear': df['fiscalYear'],
+        'fiscalQuarter': df['fiscalQuarter'],
+        'filingDate': df['filingDate'],
+        'revenue': revenue,
+        'netIncome': df['incomeNet'] / MILLION,
+        'grossMargin': df['profitGrossPerRevenue'].round(4),
+        'revenueGrowth': ((revenue - previous) / previous * 100).round(2),
+        'price': df['priceAccountingPeriodEnd'],
+        'marketCap': (df['marketCapPeriodEnd'] / MILLION).round().astype('Int64'),
+        'enterpriseValue': (df['enterpriseValue'] / MILLION).round().astype('Int64'),
+        'evToSales': df['evToSales'].round(3),
+        'evToEbitda': df['evToEbitda'].round(4),
+        'ebitdaMargin': df['ebitdaMargin'].round(4),
+        'pToE': df['pToE'].round(3),
+    }, index=df.index)
+    return metrics
+
+
+def load(payloads):
+    """Metrics frame from {symbol: (fundamentals response, valuations response)}"""
+    fundamentals = to_frame({symbol: p[0] for symbol, p in payloads.items()}, FUNDAMENTALS_COLUMNS)
+    valuations = to_frame({symbol: p[1] for symbol, p in payloads.items()}, VALUATIONS_COLUMNS)
+    return build_metrics(fundamentals, valuations)
+
+
+def latest(metrics):
+    """The most recent period of every symbol, indexed by symbol"""
+    latest = metrics[metrics.index.get_level_values('period') == 0]
+    return latest.droplevel('period')
+
+
+def screen(latest, sort_by='evToSales', ascending=True, ranges=None):
+    """Filter and sort a latest() frame.
+
+    ranges maps a column to (low, high); either bound may be None. Rows with a
+    missing value in a filtered column are dropped.
+    """
+    mask = np.ones(len(latest), dtype=bool)
+    for column, (low, high) in (ranges or {}).items():
+        values = latest[column].astype('float64').to_numpy()
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    return latest.loc[mask, SCREENER_COLUMNS].sort_values(sort_by, ascending=ascending, na_position='last')
@@ -0,0 +1,442 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import codec
+import instrumentation as _instrumentation
+import ratelimit
+import records
+
+# Shared transport for IEXStock. This lives in its own module rather than in
+# Stockdata.py because Streamlit re-executes the main script on every rerun,
+# which would throw the pooled connections away each time.
+
+POOL_SIZE = int(os.environ.get('IEX_POOL_SIZE', 20))
+TIMEOUT = (float(os.environ.get('IEX_CONNECT_TIMEOUT', 3.05)), float(os.environ.get('IEX_READ_TIMEOUT', 15)))  # seconds
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+FETCH_WORKERS = int(os.environ.get('IEX_FETCH_WORKERS', 16))
+
+CACHE_PATH = os.environ.get('IEX_CACHE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'stockdata', 'iex.sqlite'))
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+# Seconds a response stays fresh, per endpoint. Time series are handled by fundamentals_ttl.
+TTLS = {
+    'quote': 15,
+    'news': 10 * MINUTE,
+    'advanced-stats': HOUR,
+    'logo': 7 * DAY,
+    'company': 7 * DAY,
+    'dividends': DAY,
+    'institutional-ownership': DAY,
+    'insider-transactions': DAY,
+    'intraday-prices': MINUTE,
+}
+DEFAULT_TTL = HOUR
+OVERDUE_TTL = 6 * HOUR  # re-check interval once an expected filing is late
+STALE_KEEP = 30 * DAY  # expired rows older than this are dropped
+MEMORY_MAX_ENTRIES = int(os.environ.get('IEX_MEMORY_MAX_ENTRIES', 2048))
+# Upstream failures that fall back to an expired cached response when there is one
+FALLBACK_ERRORS = (ratelimit.BudgetExceeded, requests.exceptions.RetryError)
+MEMORY_MAX_BYTES = int(os.environ.get('IEX_MEMORY_MAX_BYTES', 64 * 1024 * 1024))  # measured as JSON text
+
+
+class LatencyStats:
+    """Request count and time spent on the network, per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+
+    def totals(self):
+        with self.lock:
+            count = sum(s['count'] for s in self.endpoints.values())
+            seconds = sum(s['total'] for s in self.endpoints.values())
+        return count, seconds
+
+    def to_frame(self):
+        with self.lock:
+            rows = {endpoint: dict(stats) for endpoint, stats in self.endpoints.items()}
+        df = pd.DataFrame.from_dict(rows, orient='index', columns=['count', 'total', 'max'])
+        df['mean'] = df['total'] / df['count']
+        return df.sort_values('total', ascending=False)
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry expiry, bounded by entry count and payload size"""
+
+    def __init__(self, max_entries=MEMORY_MAX_ENTRIES, max_bytes=MEMORY_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires, size, payload)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, payload, expires, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (expires, size, payload)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share the first caller's result instead of repeating the work"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> Future of the call in flight
+        self.leaders = self.followers = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': len(self.calls), 'requests': self.leaders, 'coalesced': self.followers}
+
+
+class DiskCache:
+    """Persistent response cache in SQLite, keyed by (endpoint, symbol, params)"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = self.connection()
+        db.execute('CREATE TABLE IF NOT EXISTS responses (endpoint TEXT, symbol TEXT, params TEXT, '
+                   'expires REAL, body TEXT, PRIMARY KEY (endpoint, symbol, params))')
+        db.execute('DELETE FROM responses WHERE expires < ?', (time.time() - STALE_KEEP,))
+        db.commit()
+
+    def connection(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    def entry(self, endpoint, symbol, params):
+        """(expires, JSON text) for a key, or None"""
+        return self.connection().execute(
+            'SELECT expires, body FROM responses WHERE endpoint = ? AND symbol = ? AND params = ?',
+            (endpoint, symbol or '', params)).fetchone()
+
+    def get(self, endpoint, symbol, params, stale=False):
+        row = self.entry(endpoint, symbol, params)
+        if row is None or (row[0] < time.time() and not stale):
+            return None
+        return codec.loads(row[1])
+
+    def set(self, endpoint, symbol, params, body, expires):
+        db = self.connection()
+        db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                   (endpoint, symbol or '', params, expires, body))
+        db.commit()
+
+    def clear(self):
+        db = self.connection()
+        db.execute('DELETE FROM responses')
+        db.commit()
+
+
+def fundamentals_ttl(payload):
+    """Keep a time series until the next filing, estimated from the spacing of the last two"""
+    filings = sorted(row.get('filingDate') for row in payload if hasattr(row, 'get') and row.get('filingDate'))
+    if not filings:
+        return DEFAULT_TTL
+    latest = datetime.strptime(filings[-1][:10], '%Y-%m-%d')
+    interval = timedelta(days=92)
+    if len(filings) > 1:
+        interval = latest - datetime.strptime(filings[-2][:10], '%Y-%m-%d')
+    remaining = (latest + interval - datetime.now()).total_seconds()
+    return max(remaining, OVERDUE_TTL)
+
+
+def ttl_for(endpoint, payload):
+    if endpoint.startswith('time-series/'):
+        return fundamentals_ttl(payload)
+    return TTLS.get(endpoint, DEFAULT_TTL)
+
+
+def cache_key(url, params):
+    """The params part of a cache key: url and query string without the token"""
+    query = sorted((k, v) for k, v in params.items() if k != 'token')
+    return f"{url}?{urlencode(query)}"
+
+
+latency_stats = LatencyStats()
+memory_cache = MemoryCache()
+in_flight = SingleFlight()
+disk_cache = DiskCache()
+executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='iex-fetch')
+instrumentation = _instrumentation.from_environment()
+limiter = ratelimit.TokenBucket()
+budget = ratelimit.CreditBudget(CACHE_PATH)
+
+_session = None
+_session_lock = threading.RLock()
+_local = threading.local()
+
+
+def configure(pool_size=POOL_SIZE, retries=RETRIES, backoff=BACKOFF, timeout=None):
+    """Replace the shared session, e.g. to change the pool size, retry policy or (connect, read) timeout.
+    timeout=None keeps the current one.
+    """
+    global _session, TIMEOUT
+    if timeout is not None:
+        TIMEOUT = tuple(timeout)
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                  allowed_methods=frozenset(['GET']), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None:
+        old.close()
+    return session
+
+
+def get_session():
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                configure()
+    return _session
+
+
+@contextmanager
+def refresh_ahead(seconds):
+    """On this thread, treat cached entries that expire within seconds as misses so they are re-fetched early"""
+    previous = getattr(_local, 'ahead', 0)
+    _local.ahead = seconds
+    try:
+        yield
+    finally:
+        _local.ahead = previous
+
+
+def lookup(endpoint, symbol, url, params):
+    """Fresh cached payload from memory, falling back to disk, or None"""
+    key = (endpoint, symbol or '', cache_key(url, params))
+    ahead = getattr(_local, 'ahead', 0)
+    if ahead:
+        row = disk_cache.entry(*key)
+        if row is None or row[0] < time.time() + ahead:
+            _annotate(cache='miss')
+            return None
+    payload = memory_cache.get(key)
+    if payload is None:
+        row = disk_cache.entry(*key)
+        if row is not None and row[0] >= time.time():
+            payload = codec.decode(endpoint, row[1])
+            memory_cache.set(key, payload, row[0], len(row[1]))
+            _annotate(cache='disk')
+        else:
+            _annotate(cache='miss')
+    else:
+        _annotate(cache='memory')
+    return payload
+
+
+def lookup_stale(endpoint, symbol, url, params):
+    """Cached payload from disk even if it has expired, or None"""
+    payload = disk_cache.get(endpoint, symbol, cache_key(url, params), stale=True)
+    if payload is not None:
+        _annotate(cache='stale')
+    return records.parse(endpoint, payload)
+
+
+def store(endpoint, symbol, url, params, payload):
+    """Cache a decoded response as records (see records.MODELS) and return them"""
+    key = (endpoint, symbol or '', cache_key(url, params))
+    payload = records.parse(endpoint, payload)
+    body = codec.dumps(records.dump(payload))
+    expires = time.time() + ttl_for(endpoint, payload)
+    memory_cache.set(key, payload, expires, len(body))
+    disk_cache.set(*key, body, expires)
+    return payload
+
+
+def remember(endpoint, symbol, url, params, payload):
+    """Cache a pushed update in memory only; it will be superseded within seconds, so it isn't worth a disk write"""
+    key = (endpoint, symbol or '', cache_key(url, params))
+    payload = records.parse(endpoint, payload)
+    memory_cache.set(key, payload, time.time() + ttl_for(endpoint, payload), len(codec.dumps(records.dump(payload))))
+
+
+def get(endpoint, url, params, symbol=None):
+    """Cached GET: serve a fresh cached response for (endpoint, symbol, params) or fetch and store one.
+    Endpoints in records.MODELS come back as records, others as decoded JSON.
+    Concurrent misses for the same key share a single upstream request.
+    """
+    if not instrumentation.enabled:
+        return _get(endpoint, url, params, symbol)
+    with instrumentation.span(endpoint, symbol):
+        return _get(endpoint, url, params, symbol)
+
+
+def _get(endpoint, url, params, symbol):
+    payload = lookup(endpoint, symbol, url, params)
+    if payload is None:
+        # followers of someone else's flight keep this; the leader's own lookup and fetch overwrite it
+        _annotate(cache='coalesced')
+        payload = in_flight.do((endpoint, symbol, cache_key(url, params)),
+                               lambda: _fetch_and_store(endpoint, symbol, url, params))
+    return payload
+
+
+def _fetch_and_store(endpoint, symbol, url, params):
+    # another flight may have filled the cache between our miss and taking the lead
+    payload = lookup(endpoint, symbol, url, params)
+    if payload is not None:
+        return payload
+    try:
+        payload = fetch(endpoint, url, params)
+    except FALLBACK_ERRORS:
+        # out of credits or the API keeps refusing: an old answer beats none
+        payload = lookup_stale(endpoint, symbol, url, params)
+        if payload is None:
+            raise
+        return payload
+    return store(endpoint, symbol, url, params, payload)
+
+
+def fetch_shared(endpoint, url, params):
+    """Uncached fetch, coalesced with identical requests already in flight"""
+    if not instrumentation.enabled:
+        return in_flight.do((endpoint, None, cache_key(url, params)), lambda: fetch(endpoint, url, params))
+    with instrumentation.span(endpoint) as span:
+        span['cache'] = 'coalesced'
+        return in_flight.do((endpoint, None, cache_key(url, params)), lambda: fetch(endpoint, url, params))
+
+
+def fetch(endpoint, url, params):
+    """GET url on the shared session and return the body decoded by codec.decode.
+    Raises ratelimit.BudgetExceeded instead of sending a request the credit budget can't cover.
+    """
+    cost = ratelimit.credits_for(endpoint, params)
+    level = ratelimit.current_priority()
+    budget.check(cost, level)
+    limiter.acquire(cost, level)
+    start = time.perf_counter()
+    r = get_session().get(url, params=params, timeout=TIMEOUT)
+    latency_stats.record(endpoint, time.perf_counter() - start)
+    if r.ok:
+        # IEX reports what it actually charged; fall back to our estimate
+        budget.charge(float(r.headers.get('iexcloud-messages-used', cost)))
+    _annotate(cache='miss', status=r.status_code, bytes=len(r.content), retries=_retries(r))
+    r.raise_for_status()
+    return codec.decode(endpoint, r.content)
+
+
+def _annotate(**attributes):
+    """Add attributes to this thread's instrumentation span, if there is one"""
+    span = instrumentation.current() if instrumentation.enabled else None
+    if span is not None:
+        span.update(attributes)
+
+
+def _retries(response):
+    # urllib3 leaves the retry history on the raw response; absent when nothing was retried
+    retries = getattr(response.raw, 'retries', None)
+    return len(retries.history) if retries is not None else 0
+
+
+def fetch_all(calls, return_exceptions=False):
+    """Run zero-argument callables on the shared fetch pool and return their results in order.
+    With return_exceptions, a failed call's exception takes the place of its result instead of being raised.
+
+    Calls must not themselves wait on fetch_all, or the bounded pool can deadlock.
+    """
+    context = (ratelimit.current_priority(), getattr(_local, 'ahead', 0))
+    futures = [executor.submit(_in_context, context, call) for call in calls]
+    if not return_exceptions:
+        return [future.result() for future in futures]
+    return [future.exception() or future.result() for future in futures]
+
+
+def _in_context(context, call):
+    # the pool's threads don't inherit the submitting thread's priority or refresh_ahead
+    level, ahead = context
+    with ratelimit.priority(level), refresh_ahead(ahead):
+        return call()
\ No newline at end of file
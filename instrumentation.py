@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+# Per-call records for the IEX client. Disabled by default; while disabled the
+# client only pays for one attribute check per call.
+
+SPAN_HISTORY = 500
+SPAN_COLUMNS = ['start', 'ms', 'endpoint', 'symbol', 'cache', 'status', 'bytes', 'retries']
+
+
+class Instrumentation:
+    """Collects one span per endpoint call and Prometheus-style counters, and passes spans to hooks"""
+
+    def __init__(self, enabled=False, history=SPAN_HISTORY):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = deque(maxlen=history)
+        self.hooks = []
+        self.counters = {}  # (metric, labels) -> value
+
+    def add_hook(self, hook):
+        """hook(span) is called for every finished span, on the thread that made the call"""
+        self.hooks.append(hook)
+
+    def current(self):
+        """The span of the call in progress on this thread, or None"""
+        return getattr(self.local, 'span', None)
+
+    def span(self, endpoint, symbol=None):
+        return _Span(self, endpoint, symbol)
+
+    def finish(self, span):
+        attributes = span['attributes']
+        endpoint = attributes['endpoint']
+        with self.lock:
+            self.spans.append(span)
+            self._count('iex_requests_total', endpoint=endpoint, cache=attributes.get('cache', 'none'),
+                        status=str(attributes.get('status', '')))
+            self._count('iex_request_seconds_sum', span['duration'], endpoint=endpoint)
+            self._count('iex_request_seconds_count', endpoint=endpoint)
+            self._count('iex_response_bytes_total', attributes.get('bytes', 0), endpoint=endpoint)
+            self._count('iex_retries_total', attributes.get('retries', 0), endpoint=endpoint)
+            if 'error' in attributes:
+                self._count('iex_errors_total', endpoint=endpoint)
+        for hook in self.hooks:
+            hook(span)
+
+    def _count(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def prometheus(self):
+        """Counters in the Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+        lines = []
+        for (metric, labels), value in counters:
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def to_frame(self):
+        with self.lock:
+            spans = list(self.spans)
+        rows = [{'start': pd.Timestamp(span['start'], unit='s'), 'ms': span['duration'] * 1000, **span['attributes']}
+                for span in spans]
+        df = pd.DataFrame(rows, columns=list(dict.fromkeys(SPAN_COLUMNS + [c for row in rows for c in row])))
+        return df.astype({'status': 'Int64', 'bytes': 'Int64', 'retries': 'Int64'}).iloc[::-1]
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+class _Span:
+    def __init__(self, instrumentation, endpoint, symbol):
+        self.instrumentation = instrumentation
+        self.span = {'name': f"iex.{endpoint}", 'start': time.time(),
+                     'attributes': {'endpoint': endpoint, 'symbol': symbol}}
+
+    def __enter__(self):
+        self.parent = self.instrumentation.current()
+        self.instrumentation.local.span = self.span['attributes']
+        self.started = time.perf_counter()
+        return self.span['attributes']
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span['duration'] = time.perf_counter() - self.started
+        if exc is not None:
+            self.span['attributes']['error'] = repr(exc)
+        self.instrumentation.local.span = self.parent
+        self.instrumentation.finish(self.span)
+        return False
+
+
+def opentelemetry_hook(tracer_name='stockdata.iex'):
+    """A hook that re-emits spans through OpenTelemetry; needs the opentelemetry-api package"""
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise ImportError('opentelemetry_hook requires the opentelemetry-api package') from None
+    tracer = trace.get_tracer(tracer_name)
+
+    def hook(span):
+        start = int(span['start'] * 1e9)
+        otel_span = tracer.start_span(span['name'], start_time=start,
+                                      attributes={k: v for k, v in span['attributes'].items() if v is not None})
+        otel_span.end(end_time=start + int(span['duration'] * 1e9))
+    return hook
+
+
+def from_environment():
+    """Instrumentation enabled by IEX_INSTRUMENTATION=1, with the OpenTelemetry hook if IEX_OTEL=1"""
+    instrumentation = Instrumentation(enabled=os.environ.get('IEX_INSTRUMENTATION') == '1')
+    if os.environ.get('IEX_OTEL') == '1':
+        instrumentation.enabled = True
+        instrumentation.add_hook(opentelemetry_hook())
+    return instrumentation
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+# Results derived from fetched data (comparison columns, metric frames, export
+# files), kept per browser session across Streamlit reruns. Every entry is
+# keyed by the inputs it was computed from, and anything built from stored
+# fundamentals includes timeseries.version() in its key, so a new filing makes
+# a new key instead of needing invalidation. Editing one "Add Ticker" box then
+# only recomputes what depends on that ticker.
+
+MAX_ENTRIES = 128  # per session; the least recently used entries are dropped first
+
+
+class SessionMemo:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, key, compute):
+        """compute() the first time (name, key) is asked for, the stored result after that"""
+        with self.lock:
+            if (name, key) in self.entries:
+                self.entries.move_to_end((name, key))
+                self.hits += 1
+                return self.entries[(name, key)]
+            self.misses += 1
+        value = compute()
+        self.put(name, key, value)
+        return value
+
+    def peek(self, name, key):
+        """The stored result for (name, key), or None without computing anything"""
+        with self.lock:
+            return self.entries.get((name, key))
+
+    def put(self, name, key, value):
+        with self.lock:
+            self.entries[(name, key)] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def session():
+    """This browser session's SessionMemo"""
+    if 'memo' not in st.session_state:
+        st.session_state['memo'] = SessionMemo()
+    return st.session_state['memo']
+
+
+def memoize(name, key, compute):
+    return session().get(name, key, compute)
\ No newline at end of file
@@ -0,0 +1,347 @@
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+
+# Local stand-in for the IEX Cloud routes IEXStock uses. Point the app at it with
+#   python mockiex.py --port 8000
+#   IEX_ENVIRONMENT=http://127.0.0.1:8000/v1 streamlit run Stockdata.py
+#
+# /stocksUS1Second (and the other stocksUS rates) is a server-sent events
+# stream of quotes doing a random walk, one message per --stream-interval.
+#
+# Modes:
+#   synthetic  deterministic made-up data per symbol (default)
+#   replay     serve responses saved in --fixtures, synthetic data for anything missing
+#   record     forward to --upstream with --token, save each response to --fixtures and return it
+
+SYMBOL = re.compile(r'^[A-Z][A-Z0-9.\-]{0,9}$')
+ROUTES = [
+    (re.compile(r'^/stock/market/batch$'), 'batch'),
+    (re.compile(r'^/stock/(?P<symbol>[^/]+)/(?P<endpoint>quote|company|logo|advanced-stats)$'), 'stock'),
+    (re.compile(r'^/stock/(?P<symbol>[^/]+)/news/last/(?P<last>\d+)$'), 'news'),
+    (re.compile(r'^/stock/(?P<symbol>[^/]+)/chart/(?P<range>[a-z0-9]+)$'), 'chart'),
+    (re.compile(r'^/stock/(?P<symbol>[^/]+)/intraday-prices$'), 'intraday'),
+    (re.compile(r'^/time-series/(?P<series>fundamentals|FUNDAMENTAL_VALUATIONS)/(?P<symbol>[^/]+)/(?P<period>annual|quarterly)$'), 'series'),
+]
+CHART_START = date(2008, 1, 2)  # first daily bar; 'max' returns the last 15 years of them
+CHART_DAYS = {'5d': 5, '1m': 21, '3m': 63, '6m': 126, '1y': 252, '2y': 504, '5y': 1260, 'max': 15 * 252}
+STREAM = re.compile(r'^/stocksUS(NoUTP)?(1Second|5Second|1Minute)?$')
+# Fields the real responses carry but the app never reads, so bodies have a realistic size
+UNUSED_FIELDS = {
+    'advanced-stats': ['week52high', 'week52low', 'week52change', 'sharesOutstanding', 'float', 'avg10Volume',
+                       'avg30Volume', 'ttmEPS', 'ttmDividendRate', 'dividendYield', 'nextEarningsDate', 'exDividendDate',
+                       'beta', 'maxChangePercent', 'year5ChangePercent', 'year2ChangePercent', 'year1ChangePercent',
+                       'ytdChangePercent', 'month6ChangePercent', 'month3ChangePercent', 'month1ChangePercent',
+                       'day30ChangePercent', 'day5ChangePercent', 'employees', 'putCallRatio', 'grossProfit',
+                       'totalRevenue', 'EBITDA', 'revenuePerShare', 'revenuePerEmployee', 'debtToEquity',
+                       'profitMargin', 'enterpriseValueToRevenue', 'EBITDAToRevenue', 'currentAssets',
+                       'longTermDebt', 'totalDebt', 'debtToAssets', 'nextDividendDate', 'peHigh', 'peLow'],
+    'fundamentals': ['accountsPayable', 'accountsReceivable', 'assetsCurrentCash', 'assetsCurrentOther', 'assetsTotal',
+                     'assetsUnusual', 'capex', 'cashFlowFinancing', 'cashFlowInvesting', 'cashFlowOperating',
+                     'costOfRevenue', 'debtFinancial', 'debtShortTerm', 'depreciationAndAmortizationAccumulated',
+                     'dividendsCommon', 'ebitReported', 'ebitdaReported', 'equityShareholder', 'expensesSga',
+                     'expensesTotal', 'goodwillAndIntangibles', 'incomeOperating', 'incomeTax', 'interestMinority',
+                     'inventory', 'liabilitiesCurrent', 'liabilitiesTotal', 'nibclRevenueDeferred', 'ppAndENet',
+                     'researchAndDevelopmentExpense', 'salesCost', 'sharesOutstanding', 'sharesIssued',
+                     'stockCommon', 'treasuryStockValue', 'unearnedIncome', 'workingCapital'],
+    'FUNDAMENTAL_VALUATIONS': ['accountsPayableTurnover', 'altmanZScore', 'assetTurnover', 'bookValuePerShare',
+                               'currentRatio', 'daysInAccountsPayable', 'daysInInventory', 'debtToAssets',
+                               'debtToCapitalization', 'dividendPerShare', 'ebitToRevenue', 'ebitdaToRevenue',
+                               'freeCashFlow', 'freeCashFlowToRevenue', 'incomeNetPerRevenue', 'interestBurden',
+                               'inventoryTurnover', 'leverage', 'netDebtToEbitda', 'operatingCashFlowPerShare',
+                               'pToBv', 'pToS', 'quickRatio', 'returnOnAssets', 'returnOnEquity', 'revenueGrowth',
+                               'roic', 'taxBurden', 'workingCapitalTurnover'],
+}
+
+
+class UnknownSymbol(Exception):
+    pass
+
+
+def _rng(*parts):
+    return random.Random(zlib.crc32('/'.join(str(p) for p in parts).encode()))
+
+
+def _pad(row, kind, rng):
+    for name in UNUSED_FIELDS[kind]:
+        row[name] = round(rng.uniform(-1e9, 1e9), 4)
+    return row
+
+
+def _walk(rng, start, steps, volatility):
+    prices, price = [], start
+    for _ in range(steps):
+        price *= math.exp(rng.gauss(0.0003, volatility))
+        prices.append(round(price, 2))
+    return prices
+
+
+def chart(symbol, chart_range, last=None):
+    # the same walk on every request, so the history a client stored stays consistent
+    days = [d for d in (CHART_START + timedelta(days=i) for i in range((date.today() - CHART_START).days))
+            if d.weekday() < 5]
+    prices = _walk(_rng(symbol, 'chart'), _rng(symbol).uniform(10, 500) / 4, len(days), 0.015)
+    volume = _rng(symbol, 'volume')
+    bars = [{'date': d.isoformat(), 'close': p, 'volume': int(volume.uniform(1e6, 5e7))} for d, p in zip(days, prices)]
+    if chart_range == 'ytd':
+        bars = [bar for bar in bars if bar['date'] >= f"{date.today().year}-01-01"]
+    else:
+        bars = bars[-CHART_DAYS.get(chart_range, len(bars)):]
+    return bars[-int(last):] if last else bars
+
+
+def intraday(symbol):
+    today = date.today()
+    prices = _walk(_rng(symbol, today), _rng(symbol).uniform(10, 500), 390, 0.001)
+    return [{'date': today.isoformat(), 'minute': f"{9 + (30 + i) // 60:02d}:{(30 + i) % 60:02d}",
+             'close': price, 'volume': 1000 + i} for i, price in enumerate(prices)]
+
+
+def synthetic(path, query):
+    """Deterministic response for a route, shaped like IEX Cloud's"""
+    for pattern, kind in ROUTES:
+        match = pattern.match(path)
+        if match:
+            break
+    else:
+        raise KeyError(path)
+    args = match.groupdict()
+    if kind == 'batch':
+        types = query.get('types', '').split(',')
+        last = query.get('last', '10')
+        batch = {}
+        for symbol in query.get('symbols', '').split(','):
+            try:
+                batch[symbol.upper()] = {t: synthetic(f"/stock/{symbol}/news/last/{last}" if t == 'news'
+                                                      else f"/stock/{symbol}/{t}", {}) for t in types}
+            except UnknownSymbol:
+                pass
+        return batch
+    symbol = args['symbol'].upper()
+    if not SYMBOL.match(symbol):
+        raise UnknownSymbol(symbol)
+    rng = _rng(symbol)
+    price = round(rng.uniform(10, 500), 2)
+    shares = rng.uniform(1e8, 5e9)
+    revenue = rng.uniform(1e9, 2e11)
+    if kind == 'chart':
+        return chart(symbol, args['range'], query.get('chartLast'))
+    if kind == 'intraday':
+        return intraday(symbol)
+    if kind == 'news':
+        return [{'headline': f"{symbol} headline {i + 1}", 'datetime': 1600000000000 + i * 3600000,
+                 'source': 'Mock Wire', 'url': f"https://example.com/{symbol}/{i}", 'summary': f"Summary {i + 1}",
+                 'image': f"https://example.com/{symbol}/{i}.png"} for i in range(int(args['last']))]
+    if kind == 'stock':
+        endpoint = args['endpoint']
+        if endpoint == 'logo':
+            return {'url': f"https://example.com/{symbol}/logo.png"}
+        if endpoint == 'company':
+            return {'symbol': symbol, 'companyName': f"{symbol} Corp", 'industry': 'Software',
+                    'description': f"{symbol} makes things.", 'CEO': 'Jane Doe'}
+        if endpoint == 'quote':
+            return {'symbol': symbol, 'latestPrice': price, 'peRatio': round(rng.uniform(5, 60), 2),
+                    'marketCap': int(price * shares), 'latestUpdate': int(time.time() * 1000)}
+        return _pad({'peRatio': round(rng.uniform(5, 60), 2), 'forwardPERatio': round(rng.uniform(5, 50), 2),
+                     'pegRatio': round(rng.uniform(0.5, 3), 2), 'priceToSales': round(rng.uniform(1, 15), 2),
+                     'priceToBook': round(rng.uniform(1, 20), 2), 'revenue': int(revenue), 'totalCash': int(revenue * 0.2),
+                     'currentDebt': int(revenue * 0.05), 'day200MovingAvg': round(price * 0.95, 2),
+                     'day50MovingAvg': round(price * 0.98, 2)}, endpoint, rng)
+    quarterly = args['period'] == 'quarterly'
+    step = timedelta(days=91 if quarterly else 365)
+    latest_filing = date.today() - timedelta(days=rng.randint(5, 80))
+    periods = []
+    for i in range(int(query.get('last', 4))):
+        period_rng = _rng(symbol, args['period'], i)
+        filed = latest_filing - i * step
+        period_revenue = revenue / (4 if quarterly else 1) * 0.95 ** i * period_rng.uniform(0.95, 1.05)
+        row = {'symbol': symbol, 'filingDate': filed.isoformat(), 'fiscalYear': filed.year - (0 if quarterly else 1),
+               'fiscalQuarter': (filed.month - 1) // 3 + 1 if quarterly else 4,
+               'fiscalDate': (filed - timedelta(days=40)).isoformat()}
+        if args['series'] == 'fundamentals':
+            row.update({'revenue': int(period_revenue), 'incomeNet': int(period_revenue * period_rng.uniform(0.05, 0.3)),
+                        'profitGrossPerRevenue': round(period_rng.uniform(0.2, 0.8), 6)})
+        else:
+            period_price = price * 0.92 ** i
+            market_cap = period_price * shares
+            ev = market_cap * period_rng.uniform(1.0, 1.2)
+            margin = period_rng.uniform(0.1, 0.4)
+            row.update({'priceAccountingPeriodEnd': round(period_price, 2), 'marketCapPeriodEnd': market_cap,
+                        'enterpriseValue': ev, 'pToE': market_cap / (period_revenue * 0.15),
+                        'evToSales': ev / period_revenue, 'evToEbitda': ev / (period_revenue * margin),
+                        'ebitdaMargin': margin})
+        periods.append(_pad(row, args['series'], period_rng))
+    return periods
+
+
+class Fixtures:
+    """Saved responses, one JSON file per request path and query (without the token)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def filename(self, path, query):
+        key = path.strip('/') + ('?' + urlencode(sorted(query.items())) if query else '')
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9.=_-]+', '_', key) + '.json')
+
+    def load(self, path, query):
+        if not self.directory:
+            return None
+        try:
+            with open(self.filename(path, query)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, path, query, body):
+        with open(self.filename(path, query), 'w') as f:
+            f.write(body)
+
+
+class MockIEX(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mode='synthetic', fixtures=None, upstream=None, token=None,
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=None, stream_interval=1.0):
+        super().__init__(address, Handler)
+        self.mode = mode
+        self.fixtures = Fixtures(fixtures)
+        self.upstream = upstream
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.stream_interval = stream_interval
+        self.streams = 0  # stream connections opened
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def respond(self, path, query):
+        """(status, body) for a request"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            fail = self.random.random() < self.error_rate
+            status = self.random.choice((429, 500, 503))
+        time.sleep(delay)
+        if fail:
+            return status, json.dumps({'error': 'injected'})
+        if self.mode == 'record':
+            r = requests.get(f"{self.upstream}{path}", params={**query, 'token': self.token}, timeout=30)
+            if r.ok:
+                self.fixtures.save(path, query, r.text)
+            return r.status_code, r.text
+        body = self.fixtures.load(path, query) if self.mode == 'replay' else None
+        if body is not None:
+            return 200, body
+        try:
+            return 200, json.dumps(synthetic(path, query))
+        except UnknownSymbol:
+            return 404, 'Unknown symbol'
+        except KeyError:
+            return 404, 'Not found'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path[3:] if url.path.startswith('/v1/') else url.path
+        query = {k: v for k, v in parse_qsl(url.query) if k != 'token'}
+        if STREAM.match(path):
+            return self.stream(query)
+        status, body = self.server.respond(path, query)
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, query):
+        symbols = [s.upper() for s in query.get('symbols', '').split(',') if SYMBOL.match(s.upper())]
+        quotes = [synthetic(f"/stock/{symbol}/quote", {}) for symbol in symbols]
+        with self.server.lock:
+            self.server.streams += 1
+            rng = random.Random(self.server.random.random())
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                for quote in quotes:
+                    move = math.exp(rng.gauss(0, 0.002))
+                    quote['latestPrice'] = round(quote['latestPrice'] * move, 2)
+                    quote['peRatio'] = round(quote['peRatio'] * move, 2)
+                    quote['marketCap'] = int(quote['marketCap'] * move)
+                    quote['latestUpdate'] = int(time.time() * 1000)
+                self.wfile.write(f"data: {json.dumps(quotes)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.server.stream_interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(host='127.0.0.1', port=0, **options):
+    """Run a MockIEX in a background thread and return it; base_url is what IEXStock(environment=...) takes"""
+    server = MockIEX((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mockiex', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the IEX Cloud API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', choices=['synthetic', 'replay', 'record'], default='synthetic')
+    parser.add_argument('--fixtures', help='directory of recorded responses (replay and record)')
+    parser.add_argument('--upstream', default='https://cloud.iexapis.com/v1', help='API to record from')
+    parser.add_argument('--token', default=os.environ.get('IEX_TOKEN'), help='token used when recording')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='standard deviation of the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/500')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--stream-interval', type=float, default=1.0, help='seconds between streamed quotes')
+    args = parser.parse_args()
+    if args.mode != 'synthetic' and not args.fixtures:
+        parser.error(f"--mode {args.mode} needs --fixtures")
+    if args.mode == 'record' and not args.token:
+        parser.error('--mode record needs --token or IEX_TOKEN')
+    server = MockIEX((args.host, args.port), mode=args.mode, fixtures=args.fixtures, upstream=args.upstream,
+                     token=args.token, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     seed=args.seed, stream_interval=args.stream_interval)
+    print(f"Mock IEX ({args.mode}) listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
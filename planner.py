@@ -0,0 +1,174 @@
+import pandas as pd
+
+import iexclient
+import prices
+import ratelimit
+import records
+import timeseries
+
+# Screens declare the fields they show; plan() works out the fewest endpoint
+# calls that provide them. Field names are '<source>.<field>':
+#   logo/quote/company/advanced-stats/intraday-prices.<record field>, and 'news'
+#                                                                  one batch request per 100 symbols
+#   metrics.<fundamentals.build_metrics column>                    annual series, through the time-series store
+#   quarters.<FundamentalsPeriod field>                            the last four quarterly filings, through the store
+#   bars.<Bar field>                                               daily closes, through the time-series store
+# so a screen that only shows valuation multiples never downloads fundamentals.
+
+BATCH_LIMIT = 100
+BATCHED = ['logo', 'quote', 'company', 'news', 'advanced-stats', 'intraday-prices']
+# Series each build_metrics column is computed from
+METRIC_SERIES = {
+    'fiscalYear': 'fundamentals',
+    'fiscalQuarter': 'fundamentals',
+    'filingDate': 'fundamentals',
+    'revenue': 'fundamentals',
+    'netIncome': 'fundamentals',
+    'grossMargin': 'fundamentals',
+    'revenueGrowth': 'fundamentals',
+    'price': 'FUNDAMENTAL_VALUATIONS',
+    'marketCap': 'FUNDAMENTAL_VALUATIONS',
+    'enterpriseValue': 'FUNDAMENTAL_VALUATIONS',
+    'evToSales': 'FUNDAMENTAL_VALUATIONS',
+    'evToEbitda': 'FUNDAMENTAL_VALUATIONS',
+    'ebitdaMargin': 'FUNDAMENTAL_VALUATIONS',
+    'pToE': 'FUNDAMENTAL_VALUATIONS',
+}
+SERIES_ENDPOINTS = {'fundamentals': 'time-series/fundamentals',
+                    'FUNDAMENTAL_VALUATIONS': 'time-series/FUNDAMENTAL_VALUATIONS'}
+
+
+class Task:
+    """One upstream call (or store sync) and the symbols it serves"""
+
+    def __init__(self, kind, endpoint, symbols, credits, run):
+        self.kind = kind  # 'batch', 'series', 'quarters' or 'bars'
+        self.endpoint = endpoint  # what is called, as shown by Plan.describe
+        self.symbols = symbols
+        self.credits = credits
+        self.run = run  # zero-argument callable
+
+
+class Result:
+    def __init__(self, symbols=(), series=()):
+        self.batch = {}  # symbol -> {type: record(s)}
+        self.quarters = {}  # symbol -> [FundamentalsPeriod]
+        self.failed = {}  # symbol -> exception
+        self.symbols = list(symbols)
+        self.series = series
+        self._metrics = None
+
+    @property
+    def stored(self):
+        """Symbols whose series were synced, i.e. the ones metrics covers"""
+        return [s for s in self.symbols if s not in self.failed]
+
+    @property
+    def metrics(self):
+        """build_metrics frame over the stored series, read from the store on first use"""
+        if self._metrics is None and self.series:
+            self._metrics = timeseries.load(self.stored)
+        return self._metrics
+
+
+class Plan:
+    def __init__(self, symbols, types, series, quarters, bars=False):
+        self.symbols = list(dict.fromkeys(symbols))
+        self.types = types  # batched endpoints
+        self.series = series  # time-series names synced through the store
+        self.quarters = quarters
+        self.bars = bars  # daily closes synced through the store
+
+    def tasks(self, make_stock):
+        tasks = []
+        if self.types:
+            for i in range(0, len(self.symbols), BATCH_LIMIT):
+                chunk = self.symbols[i:i + BATCH_LIMIT]
+                params = {'symbols': ','.join(chunk), 'types': ','.join(self.types)}
+                tasks.append(Task('batch', f"batch {','.join(self.types)}", chunk, ratelimit.credits_for('batch', params),
+                                  lambda chunk=chunk: make_stock(chunk[0]).get_batch(self.types, chunk)))
+        for symbol in self.symbols:
+            stock = make_stock(symbol)
+            for name in self.series:
+                endpoint = SERIES_ENDPOINTS[name]
+                fetch = stock.get_fundamentalsannual if name == 'fundamentals' else stock.get_fundamentalsannual1
+                tasks.append(Task('series', f"{endpoint} annual", [symbol], ratelimit.credits_for(endpoint, {}),
+                                  lambda name=name, symbol=symbol, fetch=fetch: timeseries.store.sync(
+                                      name, 'annual', symbol, lambda last: fetch('annual', last=last))))
+            if self.quarters:
+                tasks.append(Task('quarters', 'time-series/fundamentals quarterly', [symbol],
+                                  ratelimit.credits_for('time-series/fundamentals', {}),
+                                  lambda stock=stock: timeseries.sync_quarters(stock)))
+            if self.bars:
+                tasks.append(Task('bars', 'chart daily', [symbol], ratelimit.credits_for('chart', {}),
+                                  lambda stock=stock: prices.sync(stock)))
+        return tasks
+
+    def credits(self):
+        """Upper bound on the credits this plan costs with nothing cached"""
+        return sum(task.credits for task in self.tasks(_NoStock))
+
+    def describe(self):
+        """One row per kind of call, for showing what a view costs"""
+        rows = {}
+        for task in self.tasks(_NoStock):
+            row = rows.setdefault(task.endpoint, {'calls': 0, 'symbols': 0, 'credits': 0})
+            row['calls'] += 1
+            row['symbols'] += len(task.symbols)
+            row['credits'] += task.credits
+        if not rows:
+            return pd.DataFrame(columns=['calls', 'symbols', 'credits'])
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def run(self, make_stock, return_exceptions=False):
+        """Carry out every task concurrently and collect the results.
+        With return_exceptions, symbols whose calls failed are left out and listed in Result.failed.
+        """
+        tasks = self.tasks(make_stock)
+        outcomes = iexclient.fetch_all([task.run for task in tasks], return_exceptions=return_exceptions)
+        result = Result(self.symbols, self.series)
+        for task, outcome in zip(tasks, outcomes):
+            if isinstance(outcome, Exception):
+                result.failed.update({symbol: outcome for symbol in task.symbols})
+            elif task.kind == 'batch':
+                result.batch.update(outcome)
+            elif task.kind == 'quarters':
+                result.quarters[task.symbols[0]] = timeseries.quarters(task.symbols[0])
+        return result
+
+
+class _NoStock:
+    """Stands in for make_stock when only the shape of a plan is needed"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def plan(fields, symbols):
+    """The smallest Plan that provides fields for symbols"""
+    types, series, quarters, bars = [], [], False, False
+    for field in fields:
+        source, _, name = field.partition('.')
+        if source in BATCHED:
+            model = records.MODELS[source]
+            if name and name not in model.FIELDS:
+                raise ValueError(f"{source} has no field {name!r}")
+            types.append(source)
+        elif source == 'metrics':
+            if name not in METRIC_SERIES:
+                raise ValueError(f"Unknown metric {name!r}")
+            series.append(METRIC_SERIES[name])
+        elif source == 'quarters':
+            if name and name not in records.FundamentalsPeriod.FIELDS:
+                raise ValueError(f"Quarterly filings have no field {name!r}")
+            quarters = True
+        elif source == 'bars':
+            if name and name not in records.Bar.FIELDS:
+                raise ValueError(f"Price bars have no field {name!r}")
+            bars = True
+        else:
+            raise ValueError(f"Unknown field {field!r}")
+    return Plan(symbols, list(dict.fromkeys(types)), list(dict.fromkeys(series)), quarters, bars)
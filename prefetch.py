@@ -0,0 +1,191 @@
+import argparse
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import iexclient
+import ratelimit
+import timeseries
+
+# Keeps the cache warm for a watchlist so page loads for those symbols are hits.
+# Jobs run on one background thread at BACKGROUND priority, and re-fetch entries
+# a little before they expire rather than after. Run it inside the app (the
+# sidebar 'Prefetch' panel or IEX_WATCHLIST) or standalone against the shared
+# cache database:
+#   python prefetch.py --watchlist AAPL MSFT TSLA
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WATCHLIST = [s for s in os.environ.get('IEX_WATCHLIST', '').replace(',', ' ').upper().split() if s]
+
+
+def refresh_stats(make_stock, symbols):
+    make_stock(symbols[0]).get_batch(['advanced-stats'], symbols)
+
+
+def refresh_static(make_stock, symbols):
+    make_stock(symbols[0]).get_batch(['logo', 'company'], symbols)
+
+
+def refresh_fundamentals(make_stock, symbols):
+    # cached series and the time-series store both expire at the next expected filing
+    # (iexclient.fundamentals_ttl), so checking hourly picks up new filings soon after they land
+    calls = []
+    for symbol in symbols:
+        stock = make_stock(symbol)
+        calls += [lambda stock=stock: timeseries.sync_quarters(stock)] + timeseries.sync_calls(stock)
+    failures = [r for r in iexclient.fetch_all(calls, return_exceptions=True) if isinstance(r, Exception)]
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(calls)} series failed, first: {failures[0]!r}")
+
+
+class Job:
+    def __init__(self, name, refresh, interval, ahead):
+        self.name = name
+        self.refresh = refresh
+        self.interval = interval  # seconds between runs
+        self.ahead = ahead  # entries expiring within this many seconds are re-fetched
+        self.runs = 0
+        self.last_run = None
+        self.last_seconds = None
+        self.last_error = None
+
+
+def default_jobs():
+    # no quotes job: they expire after iexclient.TTLS['quote'], sooner than a job could keep up
+    # with, and Live quotes streams them instead
+    return [
+        Job('stats', refresh_stats, 15 * MINUTE, 20 * MINUTE),
+        Job('fundamentals', refresh_fundamentals, HOUR, HOUR),
+        Job('static', refresh_static, 6 * HOUR, DAY),
+    ]
+
+
+class Scheduler:
+    """Runs each job over the watchlist on its interval, on a daemon thread"""
+
+    def __init__(self, make_stock, watchlist=(), jobs=None):
+        self.make_stock = make_stock  # symbol -> IEXStock
+        self.watchlist = list(watchlist)
+        self.jobs = jobs or default_jobs()
+        self.queue = [(0.0, i) for i in range(len(self.jobs))]  # heap of (due, job index)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def set_watchlist(self, symbols):
+        symbols = list(dict.fromkeys(symbols))
+        if symbols != self.watchlist:
+            added = set(symbols) - set(self.watchlist)
+            self.watchlist = symbols
+            if added:
+                # new symbols get everything now rather than on each job's next turn
+                with self.lock:
+                    self.queue = [(0.0, i) for i in range(len(self.jobs))]
+                self.wakeup.set()
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.loop, name='iex-prefetch', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def loop(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                due, index = self.queue[0]
+                delay = due - time.time()
+                if delay <= 0:
+                    heapq.heappop(self.queue)
+            if delay > 0:
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+                continue
+            job = self.jobs[index]
+            self.run(job)
+            with self.lock:
+                # set_watchlist may have queued it again while it ran
+                if all(queued != index for _, queued in self.queue):
+                    heapq.heappush(self.queue, (time.time() + job.interval, index))
+
+    def run(self, job):
+        symbols = list(self.watchlist)
+        if not symbols:
+            return
+        start = time.perf_counter()
+        try:
+            with ratelimit.priority(ratelimit.BACKGROUND), iexclient.refresh_ahead(job.ahead):
+                job.refresh(self.make_stock, symbols)
+            job.last_error = None
+        except Exception as e:  # keep the scheduler alive; the error shows in status()
+            job.last_error = repr(e)
+        job.runs += 1
+        job.last_run = datetime.now()
+        job.last_seconds = time.perf_counter() - start
+
+    def status(self):
+        with self.lock:
+            due = {index: datetime.fromtimestamp(max(when, time.time())) for when, index in self.queue}
+        return pd.DataFrame([{'job': job.name, 'runs': job.runs, 'last run': job.last_run,
+                              'seconds': job.last_seconds, 'next run': due.get(i), 'error': job.last_error}
+                             for i, job in enumerate(self.jobs)]).set_index('job')
+
+
+scheduler = None
+_lock = threading.Lock()
+
+
+def start(make_stock, watchlist):
+    """Start the process-wide scheduler, or point the running one at a new watchlist"""
+    global scheduler
+    with _lock:
+        if scheduler is None:
+            scheduler = Scheduler(make_stock, watchlist)
+        else:
+            scheduler.make_stock = make_stock
+            scheduler.set_watchlist(watchlist)
+        return scheduler.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the IEX response cache warm for a watchlist')
+    parser.add_argument('--watchlist', nargs='+', default=WATCHLIST, help='symbols to keep warm')
+    parser.add_argument('--token', default=os.environ.get('IEX_TOKEN', ''))
+    parser.add_argument('--environment', default=os.environ.get('IEX_ENVIRONMENT', 'production'))
+    parser.add_argument('--once', action='store_true', help='run every job once and exit')
+    args = parser.parse_args()
+    if not args.watchlist:
+        parser.error('no symbols: pass --watchlist or set IEX_WATCHLIST')
+
+    from Stockdata import IEXStock  # importing Stockdata doesn't render the app
+
+    symbols = [s.upper() for s in args.watchlist]
+    make_stock = lambda symbol: IEXStock(args.token, symbol, environment=args.environment)  # noqa: E731
+    jobs = default_jobs()
+    if args.once:
+        runner = Scheduler(make_stock, symbols, jobs)
+        for job in jobs:
+            runner.run(job)
+        print(runner.status().to_string())
+        return
+    runner = Scheduler(make_stock, symbols, jobs).start()
+    try:
+        while True:
+            time.sleep(HOUR)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+from datetime import date, datetime, time as clock, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+import iexclient
+import ratelimit
+import timeseries
+
+# Price history for the Chart view. Daily closes are kept in the time-series
+# store (series 'chart', period 'daily') and topped up with only the days since
+# the last stored bar. That bar is asked for again and compared, because a
+# split rewrites IEX's adjusted history; a mismatch re-downloads everything.
+# Intraday (1d) bars aren't stored, the response cache is enough for them.
+#
+# Lines are downsampled here, before anything is sent to the browser, so a
+# 15-year chart stays MAX_POINTS per line:
+#   lttb    Largest-Triangle-Three-Buckets, keeps the visual shape
+#   minmax  each bucket's high and low, keeps every spike
+
+SERIES = 'chart'
+PERIOD = 'daily'
+MAX_POINTS = 1500  # per line
+MARKET = ZoneInfo('America/New_York')
+MARKET_CLOSE = clock(16, 0)  # exchange holidays are not accounted for
+SETTLE = timedelta(minutes=30)  # after the close before the day's bar is final
+RANGES = {
+    '1d': None,  # intraday
+    '5d': pd.offsets.BDay(4),
+    '1m': pd.DateOffset(months=1),
+    '3m': pd.DateOffset(months=3),
+    '6m': pd.DateOffset(months=6),
+    'ytd': pd.offsets.YearBegin(),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    'max': None,
+}
+TRADING_DAYS = 252
+INTRADAY_PERIODS = TRADING_DAYS * ratelimit.DAY_BARS  # minute bars in a year
+DOWNSAMPLERS = ['lttb', 'minmax']
+
+
+def next_close(now=None):
+    """When the next daily bar becomes final, as a timestamp"""
+    now = (now or datetime.now(MARKET)).astimezone(MARKET)
+    close = datetime.combine(now.date(), MARKET_CLOSE, MARKET) + SETTLE
+    while close <= now or close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+def sync(stock):
+    """Bring an IEXStock's daily bars up to date; returns the number of new bars.
+    Out of credits, or with IEX refusing, the stored bars are kept and the sync is retried later.
+    """
+    store = timeseries.store
+    with store.lock(SERIES, PERIOD, stock.symbol):
+        if store.expires(SERIES, PERIOD, stock.symbol) > datetime.now().timestamp():
+            return 0
+        stored = store.table(SERIES, PERIOD, stock.symbol)
+        rows = None
+        try:
+            if len(stored):
+                closes = dict(zip(stored.column('date').to_pylist(), stored.column('close').to_pylist()))
+                last = max(closes)
+                days = int(np.busday_count(last, date.today().isoformat())) + 1
+                rows = stock.get_chart('max', chartLast=days) or []
+                overlap = [row.close for row in rows if row.date == last]
+                if overlap and not np.isclose(overlap[0], closes[last], rtol=1e-4):
+                    rows = None  # adjusted for a split or dividend since we stored it
+            if rows is None:
+                rows = stock.get_chart('max') or []
+                added = store.replace(SERIES, PERIOD, stock.symbol, rows)
+            else:
+                added = store.append(SERIES, PERIOD, stock.symbol, rows)
+        except iexclient.FALLBACK_ERRORS:
+            if not len(stored):
+                raise
+            store.mark_synced(SERIES, PERIOD, stock.symbol, datetime.now().timestamp() + timeseries.RETRY_AFTER)
+            return 0
+        store.mark_synced(SERIES, PERIOD, stock.symbol, next_close())
+        return added
+
+
+def closes(symbols, chart_range='1y'):
+    """Stored daily closes over chart_range, indexed by date with a column per symbol.
+    The range ends at the latest bar of any of the symbols.
+    """
+    columns = {}
+    for symbol in symbols:
+        table = timeseries.store.table(SERIES, PERIOD, symbol)
+        series = pd.Series(table.column('close').to_numpy(),
+                           index=pd.DatetimeIndex(table.column('date').to_pylist()), dtype='float64')
+        columns[symbol] = series[~series.index.duplicated(keep='last')]
+    frame = pd.DataFrame(columns, columns=list(symbols)).sort_index()
+    frame.index.name = 'date'
+    offset = RANGES.get(chart_range)
+    if offset is not None and len(frame):
+        frame = frame[frame.index >= frame.index[-1] - offset]
+    return frame
+
+
+def intraday(payloads):
+    """{symbol: intraday-prices bars} as minute closes indexed by time, with a column per symbol"""
+    columns = {}
+    for symbol, bars in payloads.items():
+        bars = [bar for bar in bars or [] if bar.date and bar.minute]
+        index = pd.DatetimeIndex([f"{bar.date} {bar.minute}" for bar in bars])
+        columns[symbol] = pd.Series([bar.close for bar in bars], index=index, dtype='float64')
+    frame = pd.DataFrame(columns, columns=list(payloads)).sort_index()
+    frame.index.name = 'time'
+    return frame
+
+
+def version(symbols):
+    """Store version of everything closes(symbols) reads"""
+    return tuple(timeseries.store.version(SERIES, PERIOD, symbol) for symbol in symbols)
+
+
+def moving_averages(closes, windows):
+    """{window: rolling mean of every column}; NaN until a window is full"""
+    return {window: closes.rolling(window, min_periods=window).mean() for window in windows}
+
+
+def chart_lines(closes, windows=(), relative=False, history=None):
+    """closes plus a column per moving average ('AAPL 50'), on closes' index.
+    history, a longer frame ending at the same bar, fills the averages from the start of the range;
+    relative shows every line as the return since its symbol's first close.
+    """
+    averages = moving_averages(closes if history is None else history, windows)
+    lines = pd.concat([closes] + [average.reindex(closes.index).add_suffix(f" {window}")
+                                  for window, average in averages.items()], axis=1)
+    if relative:
+        base = closes.bfill().iloc[0].to_numpy()
+        lines = lines / np.tile(base, len(averages) + 1) - 1
+    return lines
+
+
+def summary(closes, periods_per_year=TRADING_DAYS):
+    """Return, annualized volatility and maximum drawdown of every column"""
+    steps = closes.ffill().pct_change()
+    return pd.DataFrame({
+        'first': closes.bfill().iloc[0],
+        'last': closes.ffill().iloc[-1],
+        'return': closes.ffill().iloc[-1] / closes.bfill().iloc[0] - 1,
+        'volatility': steps.std() * np.sqrt(periods_per_year),
+        'max drawdown': (closes / closes.cummax() - 1).min(),
+    })
+
+
+def lttb(x, y, n):
+    """Indices of the n points Largest-Triangle-Three-Buckets keeps; x ascending, no NaN"""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    # the first and last points are kept; the rest is split into n - 2 buckets
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        following = slice(hi, edges[i + 2] if i + 2 < len(edges) else size)
+        mean_x, mean_y = x[following].mean(), y[following].mean()
+        area = np.abs((x[a] - mean_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x, y, n):
+    """Indices of the lowest and highest point in each of n / 2 equal-sized buckets, plus the ends"""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+    buckets = np.arange(size) * max(n // 2, 1) // size
+    # sorted by bucket, then value: each bucket's first entry is its low and its last its high
+    order = np.lexsort((y, buckets))
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:], size) - 1
+    return np.unique(np.concatenate([order[starts], order[ends], [0, size - 1]]))
+
+
+def downsample(lines, n=MAX_POINTS, method='lttb'):
+    """Long (time, line, value) frame with at most about n points per column of lines"""
+    pick = {'lttb': lttb, 'minmax': minmax}[method]
+    frames = []
+    for name in lines.columns:
+        line = lines[name].dropna()
+        if line.empty:
+            continue
+        keep = pick(line.index.asi8.astype('float64'), line.to_numpy(), n)
+        frames.append(pd.DataFrame({'time': line.index[keep], 'line': name, 'value': line.to_numpy()[keep]}))
+    if not frames:
+        return pd.DataFrame({'time': pd.DatetimeIndex([]), 'line': pd.Series(dtype='object'),
+                             'value': pd.Series(dtype='float64')})
+    return pd.concat(frames, ignore_index=True)
\ No newline at end of file
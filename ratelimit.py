@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Client-side limits for IEX Cloud: a token bucket that paces requests by
+# their credit cost, and daily/monthly credit budgets shared by every process
+# using the same cache database.
+
+# Approximate message credits per call, from the IEX Cloud price list; check
+# them against the account's usage report. 'news' is charged per article.
+CREDITS = {
+    'quote': 1,
+    'logo': 1,
+    'company': 1,
+    'news': 1,
+    'advanced-stats': 3005,
+    'time-series/fundamentals': 1000,
+    'time-series/FUNDAMENTAL_VALUATIONS': 1000,
+    'dividends': 10,
+    'institutional-ownership': 10000,
+    'insider-transactions': 50,
+    'chart': 2,  # per daily bar, with chartCloseOnly
+    'intraday-prices': 1,  # per minute bar
+}
+DEFAULT_CREDITS = 1
+MAX_BARS = 15 * 252  # daily bars in a chart without chartLast ('max' is 15 years)
+DAY_BARS = 390  # minute bars in a full trading day
+
+RATE = float(os.environ.get('IEX_CREDITS_PER_SECOND', 100000))
+BURST = float(os.environ.get('IEX_CREDIT_BURST', 500000))
+DAILY_BUDGET = float(os.environ['IEX_DAILY_CREDITS']) if os.environ.get('IEX_DAILY_CREDITS') else None
+MONTHLY_BUDGET = float(os.environ['IEX_MONTHLY_CREDITS']) if os.environ.get('IEX_MONTHLY_CREDITS') else None
+BACKGROUND_RESERVE = 0.1  # share of each budget only interactive requests may spend
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def credits_for(endpoint, params):
+    """Estimated credits for one request; a batch costs the sum of its types for every symbol"""
+    if endpoint == 'batch':
+        symbols = [s for s in params.get('symbols', '').split(',') if s]
+        types = [t for t in params.get('types', '').split(',') if t]
+        per_symbol = sum(credits_for(t, params) for t in types)
+        return per_symbol * len(symbols)
+    if endpoint == 'news':
+        return CREDITS['news'] * int(params.get('last', 10))
+    if endpoint == 'chart':
+        return CREDITS['chart'] * int(params.get('chartLast', MAX_BARS))
+    if endpoint == 'intraday-prices':
+        return CREDITS['intraday-prices'] * DAY_BARS
+    return CREDITS.get(endpoint, DEFAULT_CREDITS)
+
+
+class TokenBucket:
+    """Credits refill at rate per second up to burst. A request bigger than the bucket
+    drains it into debt, so later requests wait for the refill instead of it never passing.
+
+    Waiting requests are served strictly by (priority, arrival), so interactive
+    requests overtake queued background ones.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.queue = []  # heap of (priority, seq)
+        self.sequence = itertools.count()
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost, priority=INTERACTIVE):
+        ticket = (priority, next(self.sequence))
+        start = time.monotonic()
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self.queue[0] == ticket and self.tokens > 0:
+                        self.tokens -= cost
+                        self.waited += time.monotonic() - start
+                        break
+                    delay = -self.tokens / self.rate if self.queue[0] == ticket else None
+                    self.condition.wait(delay)
+            finally:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            self._refill()
+            return {'tokens': round(self.tokens), 'waiting': len(self.queue), 'waited_seconds': round(self.waited, 3)}
+
+
+class CreditBudget:
+    """Credits spent per UTC day and month, kept in SQLite so every process shares one count"""
+
+    def __init__(self, path, daily=DAILY_BUDGET, monthly=MONTHLY_BUDGET):
+        self.path = path
+        self.daily = daily
+        self.monthly = monthly
+        self.local = threading.local()
+        db = self.connection()
+        db.execute('CREATE TABLE IF NOT EXISTS credits (period TEXT PRIMARY KEY, used REAL)')
+        db.commit()
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            self.local.db = db
+        return db
+
+    @staticmethod
+    def periods():
+        now = datetime.now(timezone.utc)
+        return now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+
+    def used(self):
+        """(credits used today, credits used this month)"""
+        day, month = self.periods()
+        rows = dict(self.connection().execute('SELECT period, used FROM credits WHERE period IN (?, ?)', (day, month)))
+        return rows.get(day, 0.0), rows.get(month, 0.0)
+
+    def check(self, cost, priority=INTERACTIVE):
+        """Raise BudgetExceeded if cost doesn't fit in what's left of either budget"""
+        if self.daily is None and self.monthly is None:
+            return
+        reserve = BACKGROUND_RESERVE if priority == BACKGROUND else 0.0
+        for used, limit, name in zip(self.used(), (self.daily, self.monthly), ('daily', 'monthly')):
+            if limit is not None and used + cost > limit * (1 - reserve):
+                raise BudgetExceeded(f"{name} IEX credit budget of {limit:,.0f} would be exceeded "
+                                     f"({used:,.0f} used, request costs {cost:,.0f})")
+
+    def charge(self, cost):
+        db = self.connection()
+        db.executemany('INSERT INTO credits VALUES (?, ?) ON CONFLICT(period) DO UPDATE SET used = used + excluded.used',
+                       [(period, cost) for period in self.periods()])
+        db.commit()
+
+    def stats(self):
+        day, month = self.used()
+        return {'today': day, 'daily_budget': self.daily, 'this_month': month, 'monthly_budget': self.monthly}
+
+
+_priority = threading.local()
+
+
+def current_priority():
+    return getattr(_priority, 'level', INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Requests made on this thread inside the block queue at the given priority"""
+    previous = current_priority()
+    _priority.level = level
+    try:
+        yield
+    finally:
+        _priority.level = previous
@@ -0,0 +1,172 @@
+import math
+
+# Typed, slotted records for the IEX responses the app reads. Only the fields
+# listed here are kept (in the caches too); each is converted once on the way
+# in, and a missing, null or malformed value becomes None rather than failing
+# later. Records also answer record['field'] and record.get('field') so code
+# written against the raw dicts keeps working.
+
+
+def _number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _integer(value):
+    value = _number(value)
+    return int(value) if value is not None else None
+
+
+def _text(value):
+    return str(value) if value is not None else None
+
+
+class Record:
+    __slots__ = ()
+    FIELDS = {}  # IEX field name -> converter
+
+    @classmethod
+    def parse(cls, payload):
+        record = cls.__new__(cls)
+        for name, convert in cls.FIELDS.items():
+            setattr(record, name, convert(payload.get(name)))
+        return record
+
+    @classmethod
+    def from_object(cls, obj):
+        """Record from anything with the fields as attributes, e.g. a msgspec struct"""
+        record = cls.__new__(cls)
+        for name, convert in cls.FIELDS.items():
+            setattr(record, name, convert(getattr(obj, name)))
+        return record
+
+    def to_json(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+def _record(name, fields):
+    return type(name, (Record,), {'__slots__': tuple(fields), 'FIELDS': fields})
+
+
+Logo = _record('Logo', {'url': _text})
+Quote = _record('Quote', {
+    'symbol': _text,
+    'latestPrice': _number,
+    'peRatio': _number,
+    'marketCap': _number,
+    'latestUpdate': _integer,
+})
+Company = _record('Company', {
+    'symbol': _text,
+    'companyName': _text,
+    'industry': _text,
+    'description': _text,
+    'CEO': _text,
+})
+NewsItem = _record('NewsItem', {
+    'headline': _text,
+    'datetime': _integer,
+    'source': _text,
+    'url': _text,
+    'summary': _text,
+    'image': _text,
+})
+Stats = _record('Stats', {
+    'peRatio': _number,
+    'forwardPERatio': _number,
+    'pegRatio': _number,
+    'priceToSales': _number,
+    'priceToBook': _number,
+    'revenue': _number,
+    'totalCash': _number,
+    'currentDebt': _number,
+    'day200MovingAvg': _number,
+    'day50MovingAvg': _number,
+})
+FundamentalsPeriod = _record('FundamentalsPeriod', {
+    'fiscalYear': _integer,
+    'fiscalQuarter': _integer,
+    'filingDate': _text,
+    'revenue': _number,
+    'incomeNet': _number,
+    'profitGrossPerRevenue': _number,
+})
+ValuationPeriod = _record('ValuationPeriod', {
+    'fiscalYear': _integer,
+    'fiscalQuarter': _integer,
+    'filingDate': _text,
+    'pToE': _number,
+    'priceAccountingPeriodEnd': _number,
+    'marketCapPeriodEnd': _number,
+    'evToSales': _number,
+    'enterpriseValue': _number,
+    'evToEbitda': _number,
+    'ebitdaMargin': _number,
+})
+Bar = _record('Bar', {
+    'date': _text,
+    'minute': _text,  # intraday bars only
+    'close': _number,
+    'volume': _number,
+})
+
+# Record type per iexclient endpoint; list responses become lists of records
+MODELS = {
+    'logo': Logo,
+    'quote': Quote,
+    'company': Company,
+    'news': NewsItem,
+    'advanced-stats': Stats,
+    'time-series/fundamentals': FundamentalsPeriod,
+    'time-series/FUNDAMENTAL_VALUATIONS': ValuationPeriod,
+    'chart': Bar,
+    'intraday-prices': Bar,
+}
+
+
+def parse(endpoint, payload):
+    """Records for a decoded response; endpoints without a model, and records already parsed, pass through"""
+    model = MODELS.get(endpoint)
+    if model is None or payload is None:
+        return payload
+    if isinstance(payload, list):
+        return [row if isinstance(row, Record) else model.parse(row) for row in payload if row is not None]
+    return payload if isinstance(payload, Record) else model.parse(payload)
+
+
+def dump(payload):
+    """JSON-ready form of parse()'s result"""
+    if isinstance(payload, Record):
+        return payload.to_json()
+    if isinstance(payload, list):
+        return [row.to_json() if isinstance(row, Record) else row for row in payload]
+    return payload
+
+
+def columns(rows, names):
+    """{name: [value per row]} from records or dicts, for building frames column by column"""
+    return {name: [row.get(name) for row in rows] for name in names}
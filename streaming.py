@@ -0,0 +1,214 @@
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import requests
+
+import codec
+import iexclient
+import ratelimit
+
+# Live quotes pushed over IEX's server-sent events stream instead of polling
+# /quote. Each symbol has at most one upstream connection in the process, however
+# many sessions show it, and its updates are fanned out to every subscriber.
+# A subscriber only keeps the newest quote per symbol until it is read, so a
+# session that renders slower than quotes arrive skips the ticks in between
+# (conflation) and never holds up the connection. Every update also refreshes
+# the memory cache for /quote, so get_quote and batches don't hit the REST API
+# while a symbol is being streamed.
+
+LINGER = 30  # seconds a feed stays connected after its last subscriber leaves, e.g. across a rerun
+READ_TIMEOUT = 60  # reconnect if nothing, not even a keep-alive, arrives for this long
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+CHARGE_INTERVAL = 10  # seconds between writes of streamed credits to the budget
+
+
+class Subscriber:
+    """One session's end of the feeds: the newest unread quote per symbol"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.received = 0
+        self.conflated = 0  # updates replaced by a newer one before they were read
+
+    def deliver(self, symbol, quote):
+        with self.cond:
+            if symbol in self.pending:
+                self.conflated += 1
+            self.pending[symbol] = quote
+            self.received += 1
+            self.cond.notify_all()
+
+    def wait(self, timeout):
+        """{symbol: quote} for what arrived since the last call, waiting up to timeout for something"""
+        with self.cond:
+            if not self.pending:
+                self.cond.wait(timeout)
+            pending, self.pending = self.pending, {}
+        return pending
+
+
+class Feed:
+    """The upstream stream for one symbol, read on a daemon thread"""
+
+    def __init__(self, stock):
+        self.symbol = stock.symbol.upper()
+        self.url = stock.STREAM_URL
+        self.token = stock.token
+        self.quote_url = f"{stock.BASE_URL}/stock/{stock.symbol}/quote"  # shares the /quote cache entry
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.response = None
+        self.quote = None
+        self.messages = 0
+        self.connects = 0
+        self.last_update = None
+        self.last_error = None
+        self.uncharged = 0.0
+        self.thread = threading.Thread(target=self.loop, name=f"iex-stream-{self.symbol}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        response = self.response
+        if response is not None:
+            response.close()  # unblocks the read
+
+    def add(self, subscriber):
+        with self.lock:
+            self.subscribers.add(subscriber)
+            quote = self.quote
+        if quote is not None:
+            subscriber.deliver(self.symbol, quote)
+
+    def remove(self, subscriber):
+        """Whether that was the last subscriber"""
+        with self.lock:
+            if subscriber not in self.subscribers:
+                return False
+            self.subscribers.discard(subscriber)
+            return not self.subscribers
+
+    def loop(self):
+        delay = RECONNECT_MIN
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+                delay = RECONNECT_MIN
+            except Exception as e:  # keep the feed alive; the error shows in stats()
+                if self.stopped.is_set():
+                    break
+                self.last_error = repr(e).replace(self.token, '...') if self.token else repr(e)
+            finally:
+                self.response = None
+                self.charge()
+            self.stopped.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    def listen(self):
+        cost = ratelimit.credits_for('quote', {})
+        iexclient.budget.check(cost)
+        params = {'symbols': self.symbol, 'token': self.token}
+        with requests.get(self.url, params=params, stream=True, timeout=(iexclient.TIMEOUT[0], READ_TIMEOUT)) as r:
+            self.response = r
+            r.raise_for_status()
+            self.connects += 1
+            self.last_error = None
+            charged = time.monotonic()
+            for line in r.iter_lines():
+                if self.stopped.is_set():
+                    return
+                if not line.startswith(b'data:'):
+                    continue  # keep-alive comments and event names
+                quotes = codec.decode('quote', line[5:])
+                for quote in quotes if isinstance(quotes, list) else [quotes]:
+                    if quote is not None and (quote.symbol or '').upper() == self.symbol:
+                        self.uncharged += cost
+                        self.publish(quote)
+                if time.monotonic() - charged > CHARGE_INTERVAL:
+                    self.charge()
+                    iexclient.budget.check(cost)  # stop streaming once the budget runs out
+                    charged = time.monotonic()
+
+    def publish(self, quote):
+        with self.lock:
+            quote = _fill(self.quote, quote)
+            self.quote = quote
+            self.messages += 1
+            self.last_update = datetime.now()
+            subscribers = list(self.subscribers)
+        iexclient.remember('quote', self.symbol, self.quote_url, {}, quote)
+        for subscriber in subscribers:
+            subscriber.deliver(self.symbol, quote)
+
+    def charge(self):
+        if self.uncharged:
+            cost, self.uncharged = self.uncharged, 0.0
+            iexclient.budget.charge(cost)
+
+
+def _fill(previous, quote):
+    # stream messages may leave out the multiples; scale the last known ones by the price move
+    if previous is None or not previous.latestPrice or quote.latestPrice is None:
+        return quote
+    move = quote.latestPrice / previous.latestPrice
+    if quote.peRatio is None and previous.peRatio is not None:
+        quote.peRatio = round(previous.peRatio * move, 2)
+    if quote.marketCap is None and previous.marketCap is not None:
+        quote.marketCap = previous.marketCap * move
+    return quote
+
+
+class Hub:
+    """The process's feeds, started on the first subscriber and stopped LINGER seconds after the last"""
+
+    def __init__(self, linger=LINGER):
+        self.linger = linger
+        self.feeds = {}  # (stream url, symbol) -> Feed
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscriber, stocks):
+        """Point subscriber at exactly these IEXStocks' feeds, connecting any that aren't running"""
+        wanted = {(stock.STREAM_URL, stock.symbol.upper()): stock for stock in stocks}
+        with self.lock:
+            for key, feed in self.feeds.items():
+                if key not in wanted and feed.remove(subscriber):
+                    self._stop_later(key, feed)
+            for key, stock in wanted.items():
+                feed = self.feeds.get(key)
+                if feed is None:
+                    feed = self.feeds[key] = Feed(stock).start()
+                feed.add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribe(subscriber, [])
+
+    def _stop_later(self, key, feed):
+        timer = threading.Timer(self.linger, self._stop_if_unused, (key, feed))
+        timer.daemon = True
+        timer.start()
+
+    def _stop_if_unused(self, key, feed):
+        with self.lock:
+            if feed.subscribers or self.feeds.get(key) is not feed:
+                return
+            del self.feeds[key]
+        feed.stop()
+
+    def stats(self):
+        with self.lock:
+            feeds = list(self.feeds.values())
+        return pd.DataFrame([{'symbol': feed.symbol, 'subscribers': len(feed.subscribers), 'messages': feed.messages,
+                              'connects': feed.connects, 'last update': feed.last_update, 'error': feed.last_error}
+                             for feed in feeds], columns=['symbol', 'subscribers', 'messages', 'connects',
+                                                          'last update', 'error']).set_index('symbol')
+
+
+hub = Hub()
\ No newline at end of file
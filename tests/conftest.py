@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app modules sit at the top of the repository and open their caches at
+# import, so point those at a scratch directory before anything imports them.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_scratch = tempfile.mkdtemp(prefix='stockdata-tests-')
+os.environ['IEX_CACHE_PATH'] = os.path.join(_scratch, 'iex.sqlite')
+os.environ['IEX_STORE_PATH'] = os.path.join(_scratch, 'timeseries')
+for name in ('IEX_DAILY_CREDITS', 'IEX_MONTHLY_CREDITS'):
+    os.environ.pop(name, None)
+
+import iexclient  # noqa: E402
+import mockiex  # noqa: E402
+import timeseries  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def server():
+    server = mockiex.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty TimeSeriesStore that also stands in for timeseries.store"""
+    store = timeseries.TimeSeriesStore(str(tmp_path / 'timeseries'))
+    monkeypatch.setattr(timeseries, 'store', store)
+    return store
+
+
+@pytest.fixture
+def make_stock(server):
+    """symbol -> IEXStock against the mock server, with the response caches emptied first"""
+    from Stockdata import IEXStock  # importing Stockdata doesn't render the app
+
+    iexclient.memory_cache.clear()
+    iexclient.disk_cache.clear()
+    return lambda symbol: IEXStock('', symbol, environment=server.base_url)
+
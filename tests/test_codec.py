@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import codec
+import mockiex
+
+BODIES = {
+    'quote': '/stock/AAPL/quote',
+    'company': '/stock/AAPL/company',
+    'logo': '/stock/AAPL/logo',
+    'advanced-stats': '/stock/AAPL/advanced-stats',
+    'news': '/stock/AAPL/news/last/5',
+    'time-series/fundamentals': '/time-series/fundamentals/AAPL/annual',
+    'time-series/FUNDAMENTAL_VALUATIONS': '/time-series/FUNDAMENTAL_VALUATIONS/AAPL/quarterly',
+    'chart': '/stock/AAPL/chart/1m',
+    'intraday-prices': '/stock/AAPL/intraday-prices',
+}
+
+
+@pytest.mark.parametrize('backend', codec.AVAILABLE)
+@pytest.mark.parametrize('endpoint', list(BODIES))
+def test_backends_decode_alike(endpoint, backend):
+    body = json.dumps(mockiex.synthetic(BODIES[endpoint], {'last': '8'}))
+    assert codec.decode(endpoint, body, backend) == codec.decode(endpoint, body, 'json')
+    assert codec.decode(endpoint, body.encode(), backend) == codec.decode(endpoint, body, 'json')
+
+
+@pytest.mark.parametrize('backend', codec.AVAILABLE)
+def test_backends_agree_on_nulls_and_bad_values(backend):
+    body = '[{"fiscalYear": "2023", "revenue": null, "incomeNet": "n/a", "unused": {"a": [1]}}, null, {}]'
+    rows = codec.decode('time-series/fundamentals', body, backend)
+    assert rows == codec.decode('time-series/fundamentals', body, 'json')
+    assert len(rows) == 2
+    assert rows[0].fiscalYear == 2023 and rows[0].revenue is None and rows[0].incomeNet is None
+    assert codec.decode('quote', 'null', backend) is None
+    assert codec.decode('dividends', '[{"amount": 1}]', backend) == [{'amount': 1}]
@@ -0,0 +1,52 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import export
+
+
+def sheets():
+    return {
+        'UT Analysis': pd.DataFrame({'fiscalYear': [2023, 2022], 'revenue': [220.5, np.nan]}),
+        # duplicate and mixed-type columns, like the comparison table
+        'Comparison: AAPL/MSFT': pd.DataFrame([['Price', 150.0, 'n/a'], ['P/E', 28.1, 31]],
+                                              columns=['Symbol', 'AAPL', 'AAPL']),
+    }
+
+
+def test_several_sheets_zip_one_parquet_file_each(tmp_path):
+    path = tmp_path / 'export.zip'
+    export.write(sheets(), 'parquet', path)
+    with zipfile.ZipFile(path) as archive:
+        assert sorted(archive.namelist()) == ['Comparison_ AAPL_MSFT.parquet', 'UT Analysis.parquet']
+        ut = pd.read_parquet(io.BytesIO(archive.read('UT Analysis.parquet')))
+        comparison = pd.read_parquet(io.BytesIO(archive.read('Comparison_ AAPL_MSFT.parquet')))
+    pd.testing.assert_frame_equal(ut, sheets()['UT Analysis'])
+    assert comparison.columns.tolist() == ['Symbol', 'AAPL_1', 'AAPL_2']
+    assert comparison['AAPL_2'].tolist() == ['n/a', '31']
+    assert export.file_name('data', 'parquet', sheets()) == 'data.zip'
+    assert export.mime_type('parquet', sheets()) == 'application/zip'
+
+
+def test_one_sheet_is_written_as_is(tmp_path):
+    one = {'UT Analysis': sheets()['UT Analysis']}
+    path = tmp_path / 'export.csv'
+    export.write(one, 'csv', path)
+    assert path.read_text().splitlines() == ['fiscalYear,revenue', '2023,220.5', '2022,']
+    assert export.file_name('data', 'csv', one) == 'data.csv'
+    assert export.mime_type('csv', one) == 'text/csv'
+
+
+def test_excel_has_a_worksheet_per_sheet():
+    path = export.to_tempfile(sheets(), 'xlsx')
+    try:
+        with zipfile.ZipFile(path) as workbook:
+            worksheets = [name for name in workbook.namelist() if name.startswith('xl/worksheets/sheet')]
+            names = workbook.read('xl/workbook.xml').decode()
+        assert len(worksheets) == 2
+        assert 'name="Comparison_ AAPL_MSFT"' in names
+    finally:
+        os.remove(path)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+import fundamentals
+
+
+def filing(year, revenue, **values):
+    return {'fiscalYear': year, 'fiscalQuarter': 0, 'filingDate': f"{year + 1}-02-01", 'revenue': revenue,
+            'incomeNet': revenue / 10, 'profitGrossPerRevenue': 0.456789, **values}
+
+
+def valuation(price, **values):
+    return {'priceAccountingPeriodEnd': price, 'marketCapPeriodEnd': price * 1e7, 'enterpriseValue': price * 1.1e7,
+            'evToSales': 2.34567, 'evToEbitda': 10.123456, 'ebitdaMargin': 0.2, 'pToE': 15.4321, **values}
+
+
+def test_build_metrics_scales_and_grows_within_each_symbol():
+    metrics = fundamentals.load({
+        'AAPL': ([filing(2023, 220e6), filing(2022, 200e6)], [valuation(150.0), valuation(120.0)]),
+        'MSFT': ([filing(2023, 50e6)], [valuation(300.0)]),
+    })
+    assert metrics.loc[('AAPL', 0), 'revenue'] == 220
+    assert metrics.loc[('AAPL', 0), 'netIncome'] == 22
+    assert metrics.loc[('AAPL', 0), 'revenueGrowth'] == 10.0
+    assert metrics.loc[('AAPL', 0), 'grossMargin'] == 0.4568
+    assert metrics.loc[('AAPL', 0), 'marketCap'] == 1500
+    assert metrics.loc[('AAPL', 0), 'pToE'] == 15.432
+    # the oldest period, and a symbol with one period, have nothing to grow from
+    assert np.isnan(metrics.loc[('AAPL', 1), 'revenueGrowth'])
+    assert np.isnan(metrics.loc[('MSFT', 0), 'revenueGrowth'])
+
+
+def test_missing_inputs_give_nan():
+    metrics = fundamentals.load({
+        'AAPL': ([{'fiscalYear': 2023, 'revenue': None}], [{'pToE': 12.0}]),
+        'GONE': (None, None),
+    })
+    assert metrics.index.get_level_values('symbol').tolist() == ['AAPL']
+    assert np.isnan(metrics.loc[('AAPL', 0), 'revenue'])
+    assert np.isnan(metrics.loc[('AAPL', 0), 'price'])
+    assert pd.isna(metrics.loc[('AAPL', 0), 'marketCap'])
+    assert metrics.loc[('AAPL', 0), 'fiscalYear'] == 2023
+    assert metrics.loc[('AAPL', 0), 'pToE'] == 12.0
+
+
+def universe():
+    return fundamentals.latest(fundamentals.load({
+        'CHEAP': ([filing(2023, 100e6)], [valuation(10.0, evToSales=1.0, pToE=8.0)]),
+        'MID': ([filing(2023, 100e6)], [valuation(20.0, evToSales=3.0, pToE=None)]),
+        'DEAR': ([filing(2023, 100e6)], [valuation(30.0, evToSales=9.0, pToE=40.0)]),
+        'BLANK': ([filing(2023, 100e6)], [valuation(40.0, evToSales=None, pToE=20.0)]),
+    }))
+
+
+def test_screen_sorts_with_missing_values_last():
+    assert fundamentals.screen(universe()).index.tolist() == ['CHEAP', 'MID', 'DEAR', 'BLANK']
+    assert fundamentals.screen(universe(), ascending=False).index.tolist() == ['DEAR', 'MID', 'CHEAP', 'BLANK']
+
+
+def test_screen_ranges_drop_missing_values():
+    latest = universe()
+    assert fundamentals.screen(latest, ranges={'evToSales': (2, None)}).index.tolist() == ['MID', 'DEAR']
+    assert fundamentals.screen(latest, sort_by='pToE', ranges={'pToE': (None, 30)}).index.tolist() == ['CHEAP', 'BLANK']
+    screened = fundamentals.screen(latest, ranges={'evToSales': (0, 5), 'pToE': (0, 50)})
+    assert screened.index.tolist() == ['CHEAP']
+    assert screened.columns.tolist() == fundamentals.SCREENER_COLUMNS
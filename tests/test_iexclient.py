@@ -0,0 +1,111 @@
+import threading
+import time
+
+import iexclient
+
+
+def test_configure_timeout(monkeypatch):
+    monkeypatch.setattr(iexclient, 'TIMEOUT', iexclient.TIMEOUT)
+    iexclient.configure(timeout=(1, 2))
+    assert iexclient.TIMEOUT == (1, 2)
+    iexclient.configure(pool_size=5)  # other settings leave the timeout alone
+    assert iexclient.TIMEOUT == (1, 2)
+    iexclient.configure()
+
+
+def test_first_session_keeps_timeout(monkeypatch):
+    monkeypatch.setattr(iexclient, 'TIMEOUT', (4, 5))
+    monkeypatch.setattr(iexclient, '_session', None)
+    assert iexclient.get_session() is not None
+    assert iexclient.TIMEOUT == (4, 5)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = iexclient.MemoryCache(max_entries=2, max_bytes=1000)
+    expires = time.time() + 60
+    cache.set('a', 1, expires, 10)
+    cache.set('b', 2, expires, 10)
+    assert cache.get('a') == 1  # now 'b' is the oldest
+    cache.set('c', 3, expires, 10)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_cache_bounded_by_bytes():
+    cache = iexclient.MemoryCache(max_entries=10, max_bytes=25)
+    expires = time.time() + 60
+    cache.set('a', 1, expires, 10)
+    cache.set('b', 2, expires, 10)
+    cache.set('c', 3, expires, 10)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 20
+    cache.set('huge', 4, expires, 26)  # bigger than the whole cache: not kept, nothing evicted
+    assert cache.get('huge') is None
+    assert (cache.get('b'), cache.get('c')) == (2, 3)
+
+
+def test_memory_cache_expiry():
+    cache = iexclient.MemoryCache()
+    cache.set('a', 1, time.time() - 1, 10)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['bytes'] == 0
+
+
+def test_single_flight_shares_one_call():
+    flight = iexclient.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'payload'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(5)]
+    threads[0].start()
+    while not flight.stats()['in_flight']:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['coalesced'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['payload'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'in_flight': 0, 'requests': 1, 'coalesced': 4}
+
+
+def test_single_flight_shares_errors_and_forgets_the_call():
+    flight = iexclient.SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError('upstream')
+
+    errors = []
+
+    def follow():
+        try:
+            flight.do('key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=follow)
+    leader.start()
+    while not flight.stats()['in_flight']:
+        time.sleep(0.001)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    while not flight.stats()['coalesced']:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2
+    assert flight.do('key', lambda: 'again') == 'again'
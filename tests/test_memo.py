@@ -0,0 +1,32 @@
+import memo
+
+
+def test_computes_once_per_key():
+    cache = memo.SessionMemo()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get('column', ('AAPL', 1), compute) == 1
+    assert cache.get('column', ('AAPL', 1), compute) == 1
+    assert cache.get('column', ('AAPL', 2), compute) == 2  # new version, new key
+    assert cache.get('table', ('AAPL', 1), compute) == 3  # names don't share entries
+    assert cache.stats() == {'entries': 3, 'hits': 1, 'misses': 3}
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = memo.SessionMemo(max_entries=2)
+    cache.put('column', 'AAPL', 1)
+    cache.put('column', 'MSFT', 2)
+    assert cache.get('column', 'AAPL', lambda: None) == 1  # now MSFT is the oldest
+    cache.put('column', 'GOOG', 3)
+    assert cache.peek('column', 'MSFT') is None
+    assert (cache.peek('column', 'AAPL'), cache.peek('column', 'GOOG')) == (1, 3)
+
+
+def test_peek_never_computes():
+    cache = memo.SessionMemo()
+    assert cache.peek('export', 'key') is None
+    assert cache.stats() == {'entries': 0, 'hits': 0, 'misses': 0}
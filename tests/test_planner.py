@@ -0,0 +1,46 @@
+import pytest
+
+import planner
+
+
+def test_fields_map_to_the_fewest_calls():
+    plan = planner.plan(['quote.latestPrice', 'logo.url', 'quote.peRatio', 'news'], ['AAPL', 'MSFT', 'AAPL'])
+    assert plan.symbols == ['AAPL', 'MSFT']
+    assert plan.types == ['quote', 'logo', 'news']
+    assert plan.series == [] and not plan.quarters and not plan.bars
+    calls = plan.describe()
+    assert calls.index.tolist() == ['batch quote,logo,news']
+    assert calls.loc['batch quote,logo,news', 'calls'] == 1
+
+
+def test_metrics_only_sync_the_series_they_use():
+    assert planner.plan(['metrics.pToE', 'metrics.evToSales'], ['AAPL']).series == ['FUNDAMENTAL_VALUATIONS']
+    assert planner.plan(['metrics.revenueGrowth', 'metrics.price'], ['AAPL']).series == \
+        ['fundamentals', 'FUNDAMENTAL_VALUATIONS']
+    plan = planner.plan(['quarters.revenue', 'bars.close'], ['AAPL', 'MSFT'])
+    assert plan.types == [] and plan.quarters and plan.bars
+    assert plan.describe()['calls'].to_dict() == {'time-series/fundamentals quarterly': 2, 'chart daily': 2}
+
+
+def test_batches_hold_at_most_batch_limit_symbols():
+    symbols = [f"S{i}" for i in range(2 * planner.BATCH_LIMIT + 1)]
+    plan = planner.plan(['quote.latestPrice'], symbols)
+    tasks = plan.tasks(planner._NoStock)
+    assert [len(task.symbols) for task in tasks] == [planner.BATCH_LIMIT, planner.BATCH_LIMIT, 1]
+    assert plan.credits() == sum(task.credits for task in tasks)
+
+
+@pytest.mark.parametrize('field', ['quote.nope', 'metrics.nope', 'quarters.nope', 'bars.nope', 'bogus.field'])
+def test_unknown_fields_are_rejected(field):
+    with pytest.raises(ValueError):
+        planner.plan([field], ['AAPL'])
+
+
+def test_run_collects_batches_series_and_failures(store, make_stock):
+    fields = ['company.companyName', 'quarters.revenue', 'metrics.pToE']
+    result = planner.plan(fields, ['MSFT', 'BAD$']).run(make_stock, return_exceptions=True)
+    assert result.batch['MSFT']['company'].companyName
+    assert len(result.quarters['MSFT']) == 4
+    assert list(result.failed) == ['BAD$']
+    assert result.stored == ['MSFT']
+    assert result.metrics.index.get_level_values('symbol').unique().tolist() == ['MSFT']
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import iexclient
+import mockiex
+import prices
+import ratelimit
+
+
+def noisy_sine(size):
+    x = np.arange(size, dtype='float64')
+    y = np.sin(x / 500) + np.random.default_rng(0).normal(0, 0.1, size)
+    return x, y
+
+
+def test_lttb_keeps_n_points_and_the_ends():
+    x, y = noisy_sine(10000)
+    keep = prices.lttb(x, y, 500)
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(1000, dtype='float64')
+    y = np.zeros(1000)
+    y[617] = 10
+    assert 617 in prices.lttb(x, y, 50)
+
+
+def test_downsamplers_leave_short_lines_alone():
+    x, y = noisy_sine(100)
+    assert np.array_equal(prices.lttb(x, y, 100), np.arange(100))
+    assert np.array_equal(prices.minmax(x, y, 200), np.arange(100))
+
+
+def test_minmax_keeps_every_extreme():
+    x, y = noisy_sine(10000)
+    keep = prices.minmax(x, y, 500)
+    assert len(keep) <= 502
+    assert y[keep].max() == y.max() and y[keep].min() == y.min()
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    # each bucket's own high and low survive
+    for bucket in np.array_split(np.arange(10000), 250)[:5]:
+        assert bucket[y[bucket].argmax()] in keep and bucket[y[bucket].argmin()] in keep
+
+
+def test_downsample_limits_every_line():
+    index = pd.date_range('2010-01-01', periods=5000, freq='D')
+    lines = pd.DataFrame({'AAPL': np.linspace(1, 2, 5000), 'MSFT': np.nan}, index=index)
+    lines.iloc[-100:, 1] = 1.0
+    for method in prices.DOWNSAMPLERS:
+        points = prices.downsample(lines, n=300, method=method)
+        counts = points.groupby('line').size()
+        assert counts['AAPL'] <= 302 and counts['MSFT'] <= 100
+
+
+def test_sync_tops_up_stored_bars(store, make_stock):
+    stock = make_stock('NFLX')
+    first = prices.sync(stock)
+    assert first > 0
+    assert prices.sync(stock) == 0  # nothing new before the next close
+    stored = store.table(prices.SERIES, prices.PERIOD, 'NFLX').to_pylist()
+    # without the newest ten bars, the next sync asks for those days only
+    store.replace(prices.SERIES, prices.PERIOD, 'NFLX', stored[:-10])
+    store.mark_synced(prices.SERIES, prices.PERIOD, 'NFLX', 0)
+    assert prices.sync(stock) == 10
+    assert len(store.table(prices.SERIES, prices.PERIOD, 'NFLX')) == first
+
+
+def test_sync_out_of_credits_keeps_stored_bars(store, make_stock, tmp_path, monkeypatch):
+    stock = make_stock('NFLX')
+    first = prices.sync(stock)
+    store.mark_synced(prices.SERIES, prices.PERIOD, 'NFLX', 0)
+    monkeypatch.setattr(iexclient, 'budget', ratelimit.CreditBudget(str(tmp_path / 'credits.sqlite'), daily=0))
+    assert prices.sync(stock) == 0
+    assert len(prices.closes(['NFLX'], 'max')) == first
+    with pytest.raises(ratelimit.BudgetExceeded):
+        prices.sync(make_stock('AMZN'))
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Controls the mock's daily bars: whether today's bar is out yet, and a split since the start"""
+    state = {'closed': False, 'split': 1}
+    original = mockiex.chart
+
+    def chart(symbol, chart_range, last=None):
+        bars = original(symbol, chart_range)
+        if not state['closed']:
+            bars = bars[:-1]
+        bars = [{**bar, 'close': round(bar['close'] / state['split'], 2)} for bar in bars]
+        return bars[-int(last):] if last else bars
+
+    monkeypatch.setattr(mockiex, 'chart', chart)
+    return state
+
+
+def test_resync_after_the_close_gets_the_new_bar(store, make_stock, upstream):
+    stock = make_stock('NFLX')
+    first = prices.sync(stock)
+    store.mark_synced(prices.SERIES, prices.PERIOD, 'NFLX', 0)
+    assert prices.sync(stock) == 0  # during the day: nothing new
+    upstream['closed'] = True
+    store.mark_synced(prices.SERIES, prices.PERIOD, 'NFLX', 0)
+    assert prices.sync(stock) == 1  # the same request as before, but not answered from a cache
+    assert len(store.table(prices.SERIES, prices.PERIOD, 'NFLX')) == first + 1
+
+
+def test_resync_after_a_split_rewrites_history(store, make_stock, upstream):
+    stock = make_stock('NFLX')
+    assert prices.sync(stock) > 0
+    before = prices.closes(['NFLX'], 'max')
+    upstream['split'] = 2
+    store.mark_synced(prices.SERIES, prices.PERIOD, 'NFLX', 0)
+    prices.sync(stock)
+    after = prices.closes(['NFLX'], 'max')
+    assert len(after) == len(before)
+    assert np.allclose(after['NFLX'], before['NFLX'] / 2, atol=0.01)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+import ratelimit
+
+
+def test_interactive_requests_overtake_queued_background_ones():
+    bucket = ratelimit.TokenBucket(rate=100, burst=10)
+    bucket.acquire(60)  # 50 credits of debt: the next request waits about half a second
+    order = []
+
+    def acquire(name, priority):
+        bucket.acquire(1, priority)
+        order.append(name)
+
+    background = threading.Thread(target=acquire, args=('background', ratelimit.BACKGROUND))
+    background.start()
+    while not bucket.stats()['waiting']:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=acquire, args=('interactive', ratelimit.INTERACTIVE))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+    assert order == ['interactive', 'background']
+
+
+def test_requests_of_one_priority_are_served_in_arrival_order():
+    bucket = ratelimit.TokenBucket(rate=200, burst=1)
+    bucket.acquire(21)
+    order = []
+    threads = []
+    for i in range(3):
+        thread = threading.Thread(target=lambda i=i: (bucket.acquire(1), order.append(i)))
+        thread.start()
+        threads.append(thread)
+        while bucket.stats()['waiting'] < i + 1:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2]
+
+
+def test_bucket_debt_is_repaid_before_the_next_request():
+    bucket = ratelimit.TokenBucket(rate=100, burst=10)
+    start = time.monotonic()
+    bucket.acquire(30)  # bigger than the bucket, but still passes
+    assert time.monotonic() - start < 0.05
+    bucket.acquire(1)
+    assert time.monotonic() - start >= 0.19
+
+
+def test_budget_keeps_a_reserve_from_background_work(tmp_path):
+    budget = ratelimit.CreditBudget(str(tmp_path / 'credits.sqlite'), daily=100)
+    budget.charge(85)
+    budget.check(10)
+    with pytest.raises(ratelimit.BudgetExceeded):
+        budget.check(10, ratelimit.BACKGROUND)
+    with pytest.raises(ratelimit.BudgetExceeded, match='daily'):
+        budget.check(20)
+    assert budget.used() == (85, 85)
+
+
+def test_budget_is_shared_through_the_database(tmp_path):
+    path = str(tmp_path / 'credits.sqlite')
+    ratelimit.CreditBudget(path, monthly=50).charge(40)
+    other = ratelimit.CreditBudget(path, monthly=50)
+    assert other.stats()['this_month'] == 40
+    with pytest.raises(ratelimit.BudgetExceeded, match='monthly'):
+        other.check(20)
+
+
+def test_credit_estimates():
+    assert ratelimit.credits_for('batch', {'symbols': 'AAPL,MSFT', 'types': 'quote,news', 'last': '5'}) == \
+        2 * (ratelimit.CREDITS['quote'] + 5 * ratelimit.CREDITS['news'])
+    assert ratelimit.credits_for('chart', {'chartLast': 10}) == 10 * ratelimit.CREDITS['chart']
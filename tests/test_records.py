@@ -0,0 +1,32 @@
+import records
+
+
+def test_null_missing_and_malformed_values_become_none():
+    quote = records.parse('quote', {'symbol': 'AAPL', 'latestPrice': 'n/a', 'peRatio': None,
+                                    'marketCap': float('inf'), 'latestUpdate': '1700000000000.0', 'extra': 1})
+    assert quote.symbol == 'AAPL'
+    assert quote.latestPrice is None and quote.peRatio is None and quote.marketCap is None
+    assert quote.latestUpdate == 1700000000000
+    stats = records.parse('advanced-stats', {'peRatio': True, 'revenue': '123.5'})
+    assert stats.peRatio is None  # a bool is not a number
+    assert stats.revenue == 123.5
+    assert stats.totalCash is None  # not in the payload at all
+
+
+def test_lists_drop_null_rows_and_unmodelled_endpoints_pass_through():
+    rows = records.parse('time-series/fundamentals', [{'fiscalYear': 2023, 'revenue': None}, None])
+    assert len(rows) == 1
+    assert rows[0].fiscalYear == 2023 and rows[0].revenue is None
+    assert records.parse('quote', None) is None
+    assert records.parse('dividends', [{'amount': 1}]) == [{'amount': 1}]
+    assert records.parse('time-series/fundamentals', rows) == rows  # already parsed
+
+
+def test_records_read_like_the_raw_dicts():
+    quote = records.parse('quote', {'symbol': 'AAPL', 'latestPrice': 150})
+    assert quote['latestPrice'] == 150.0
+    assert quote.get('peRatio', 'n/a') == 'n/a'
+    assert quote.get('unknown') is None
+    assert records.dump(quote) == {'symbol': 'AAPL', 'latestPrice': 150.0, 'peRatio': None,
+                                   'marketCap': None, 'latestUpdate': None}
+    assert records.parse('quote', records.dump(quote)) == quote
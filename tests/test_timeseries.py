@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+import ratelimit
+import timeseries
+
+
+def annual(years, **values):
+    """IEX-style annual rows for years, newest first; each value is scaled by the year"""
+    return [{'fiscalYear': year, 'fiscalQuarter': 0, 'filingDate': f"{year + 1}-02-01",
+             **{name: value * year for name, value in values.items()}}
+            for year in sorted(years, reverse=True)]
+
+
+class Upstream:
+    """fetch(last) over a fixed history, recording what was asked for"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __call__(self, last):
+        self.calls.append(last)
+        return self.rows[:last]
+
+
+def test_first_sync_downloads_full_history(store):
+    upstream = Upstream(annual(range(1990, 2024), revenue=1.0))
+    assert store.sync('fundamentals', 'annual', 'AAPL', upstream) == timeseries.HISTORY['annual']
+    assert upstream.calls == [timeseries.HISTORY['annual']]
+    assert store.expires('fundamentals', 'annual', 'AAPL') > time.time()
+
+
+def test_sync_widens_until_it_overlaps(store):
+    store.sync('fundamentals', 'annual', 'AAPL', Upstream(annual(range(2000, 2018), revenue=1.0)))
+    store.mark_synced('fundamentals', 'annual', 'AAPL', 0)
+    upstream = Upstream(annual(range(2000, 2024), revenue=1.0))
+    assert store.sync('fundamentals', 'annual', 'AAPL', upstream) == 6
+    assert upstream.calls == [1, 4, 16]
+    assert sorted(store.table('fundamentals', 'annual', 'AAPL').column('fiscalYear').to_pylist()) == list(range(2000, 2024))
+
+
+def test_sync_up_to_date_symbol(store):
+    upstream = Upstream(annual(range(2010, 2024), revenue=1.0))
+    store.sync('fundamentals', 'annual', 'AAPL', upstream)
+    assert store.sync('fundamentals', 'annual', 'AAPL', upstream) == 0
+    assert len(upstream.calls) == 1  # not due yet
+    store.mark_synced('fundamentals', 'annual', 'AAPL', 0)
+    assert store.sync('fundamentals', 'annual', 'AAPL', upstream) == 0
+    assert upstream.calls[1:] == [1]
+
+
+def test_append_skips_stored_periods(store):
+    assert store.append('fundamentals', 'annual', 'AAPL', annual([2022, 2023], revenue=1.0)) == 2
+    assert store.append('fundamentals', 'annual', 'AAPL', annual([2023, 2024], revenue=1.0)) == 1
+    assert len(store.table('fundamentals', 'annual', 'AAPL')) == 3
+
+
+def test_compaction_merges_parts(store):
+    for year in range(2000, 2000 + timeseries.COMPACT_PARTS):
+        store.append('fundamentals', 'annual', 'AAPL', annual([year], revenue=1.0))
+    assert len(store.parts('fundamentals', 'annual', 'AAPL')) == timeseries.COMPACT_PARTS
+    version = store.version('fundamentals', 'annual', 'AAPL')
+    store.append('fundamentals', 'annual', 'AAPL', annual([2100], revenue=1.0))
+    assert len(store.parts('fundamentals', 'annual', 'AAPL')) == 1
+    assert store.version('fundamentals', 'annual', 'AAPL') != version
+    years = store.table('fundamentals', 'annual', 'AAPL').column('fiscalYear').to_pylist()
+    assert sorted(years) == list(range(2000, 2000 + timeseries.COMPACT_PARTS)) + [2100]
+
+
+def test_sync_out_of_credits_serves_stored(store):
+    store.sync('fundamentals', 'annual', 'AAPL', Upstream(annual(range(2010, 2024), revenue=1.0)))
+    store.mark_synced('fundamentals', 'annual', 'AAPL', 0)
+
+    def refused(last):
+        raise ratelimit.BudgetExceeded('out of credits')
+
+    assert store.sync('fundamentals', 'annual', 'AAPL', refused) == 0
+    assert len(store.table('fundamentals', 'annual', 'AAPL')) == 14
+    assert 0 < store.expires('fundamentals', 'annual', 'AAPL') - time.time() <= timeseries.RETRY_AFTER
+    with pytest.raises(ratelimit.BudgetExceeded):
+        store.sync('fundamentals', 'annual', 'MSFT', refused)
+
+
+def test_load_matches_series_on_fiscal_period(store):
+    # valuations are a year ahead of fundamentals: the rows must meet on fiscalYear, not position
+    store.append('fundamentals', 'annual', 'AAPL', annual([2021, 2022, 2023], revenue=1.0, incomeNet=0.1))
+    store.append('FUNDAMENTAL_VALUATIONS', 'annual', 'AAPL',
+                 annual([2022, 2023, 2024], priceAccountingPeriodEnd=1.0, pToE=0.01))
+    metrics = timeseries.load(['AAPL']).loc['AAPL']
+    assert metrics['fiscalYear'].tolist() == [2024, 2023, 2022, 2021]
+    by_year = metrics.set_index('fiscalYear')
+    assert by_year.loc[2023, 'price'] == 2023
+    assert by_year.loc[2022, 'price'] == 2022
+    assert by_year['price'].isna().tolist() == [False, False, False, True]
+    assert by_year['revenue'].isna().tolist() == [True, False, False, False]
+
+
+def test_sync_through_mock_api(store, server, make_stock):
+    stock = make_stock('MSFT')
+    for call in timeseries.sync_calls(stock):
+        assert call() == timeseries.HISTORY['annual']
+    assert timeseries.sync_quarters(stock) == timeseries.HISTORY['quarterly']
+    requests = server.requests
+    for call in timeseries.sync_calls(stock):
+        assert call() == 0
+    assert timeseries.sync_quarters(stock) == 0
+    assert server.requests == requests  # nothing due until the next filing
+
+    quarters = timeseries.quarters('MSFT')
+    assert len(quarters) == 4
+    keys = [(q.fiscalYear, q.fiscalQuarter) for q in quarters]
+    assert keys == sorted(keys, reverse=True)
+    assert len(timeseries.load(['MSFT'])) == timeseries.HISTORY['annual']
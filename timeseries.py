@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import fundamentals
+import iexclient
+import records
+
+# Local store of every fundamentals and valuations period ever fetched. Past
+# fiscal periods don't change, so each one is downloaded once; a sync only asks
+# IEX for periods newer than what's on disk, and only once the next filing is
+# due. Data lives in uncompressed Arrow IPC files, one directory per
+# (series, period, symbol), read through memory maps without copying:
+#   <STORE_PATH>/fundamentals/annual/AAPL/<part>.arrow
+# Restatements of an already stored period are not picked up. prices.py keeps
+# daily bars here too, as series 'chart', keyed by date.
+
+STORE_PATH = os.environ.get('IEX_STORE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'stockdata', 'timeseries'))
+HISTORY = {'annual': 20, 'quarterly': 80}  # periods requested on a symbol's first sync
+COMPACT_PARTS = 16  # parts per symbol before they are merged into one file
+RETRY_AFTER = 5 * 60  # seconds before a sync that ran out of credits is tried again
+
+KEY = ['fiscalYear', 'fiscalQuarter']
+KEYS = {'chart': ['date']}  # series not keyed by KEY
+COLUMNS = {
+    'fundamentals': fundamentals.FUNDAMENTALS_COLUMNS,
+    'FUNDAMENTAL_VALUATIONS': {'fiscalYear': 'Int64', 'fiscalQuarter': 'Int64', 'filingDate': 'object',
+                               **fundamentals.VALUATIONS_COLUMNS},
+    'chart': {'date': 'object', 'close': 'float64', 'volume': 'float64'},
+}
+FUNDAMENTALS_SERIES = ['fundamentals', 'FUNDAMENTAL_VALUATIONS']
+ARROW_TYPES = {'Int64': pa.int64(), 'float64': pa.float64(), 'object': pa.string()}
+
+
+def schema(series):
+    return pa.schema([(column, ARROW_TYPES[dtype]) for column, dtype in COLUMNS[series].items()])
+
+
+class TimeSeriesStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def directory(self, series, period, symbol):
+        return os.path.join(self.path, series, period, symbol.upper())
+
+    def lock(self, series, period, symbol):
+        with self.locks_lock:
+            return self.locks.setdefault((series, period, symbol.upper()), threading.Lock())
+
+    def parts(self, series, period, symbol):
+        directory = self.directory(series, period, symbol)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.arrow'))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in names]
+
+    def table(self, series, period, symbol):
+        """Every stored row for a symbol, memory-mapped; rows are in the order they were added"""
+        for _ in range(3):
+            try:
+                tables = [_read(part) for part in self.parts(series, period, symbol)]
+                break
+            except FileNotFoundError:  # parts merged by another process while we listed them
+                continue
+        else:
+            raise RuntimeError(f"{series}/{period}/{symbol} keeps changing while being read")
+        if not tables:
+            return schema(series).empty_table()
+        return pa.concat_tables(tables)
+
+    def append(self, series, period, symbol, rows):
+        """Add rows (records or IEX response dicts) for periods not stored yet; returns how many were new"""
+        key = KEYS.get(series, KEY)
+        stored = self.table(series, period, symbol)
+        have = set(zip(*(stored.column(k).to_pylist() for k in key)))
+        new = [row for row in rows if tuple(row.get(k) for k in key) not in have]
+        if not new:
+            return 0
+        directory = self.directory(series, period, symbol)
+        os.makedirs(directory, exist_ok=True)
+        _write(os.path.join(directory, f"{time.time_ns()}-{os.getpid()}.arrow"), _table(series, new))
+        parts = self.parts(series, period, symbol)
+        if len(parts) > COMPACT_PARTS:
+            self.compact(series, period, symbol, parts)
+        return len(new)
+
+    def replace(self, series, period, symbol, rows):
+        """Store rows instead of everything stored for a symbol, e.g. after a split rewrote adjusted prices"""
+        parts = self.parts(series, period, symbol)
+        directory = self.directory(series, period, symbol)
+        os.makedirs(directory, exist_ok=True)
+        _write(os.path.join(directory, f"{time.time_ns()}-{os.getpid()}.arrow"), _table(series, rows))
+        for part in parts:
+            os.remove(part)
+        return len(rows)
+
+    def compact(self, series, period, symbol, parts):
+        merged = pa.concat_tables([_read(part) for part in parts])
+        _write(parts[-1] + '.merged', merged)
+        os.replace(parts[-1] + '.merged', parts[-1])
+        for part in parts[:-1]:
+            os.remove(part)
+
+    def version(self, series, period, symbol):
+        """Changes whenever a symbol's stored rows do, for keying results computed from them"""
+        return tuple(os.path.basename(part) for part in self.parts(series, period, symbol))
+
+    def mark_synced(self, series, period, symbol, expires):
+        directory = self.directory(series, period, symbol)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'synced'), 'w') as f:
+            f.write(repr(expires))
+
+    def expires(self, series, period, symbol):
+        try:
+            with open(os.path.join(self.directory(series, period, symbol), 'synced')) as f:
+                return float(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0.0
+
+    def sync(self, series, period, symbol, fetch):
+        """Bring a symbol's series up to date. fetch(last) returns the last periods, newest first.
+
+        Asks for one period, then 4, 16, ... until the response overlaps what's
+        stored, so an up-to-date symbol costs one small request. Returns the
+        number of new periods. Out of credits, or with IEX refusing, what's
+        stored is served and the sync is retried after RETRY_AFTER.
+        """
+        with self.lock(series, period, symbol):
+            if self.expires(series, period, symbol) > time.time():
+                return 0
+            stored = self.table(series, period, symbol)
+            have = set(zip(*(stored.column(k).to_pylist() for k in KEY)))
+            last = 1 if have else HISTORY[period]
+            try:
+                while True:
+                    rows = fetch(last) or []
+                    new = [row for row in rows if (row.get('fiscalYear'), row.get('fiscalQuarter')) not in have]
+                    if len(new) < len(rows) or len(rows) < last or last >= HISTORY[period]:
+                        break
+                    last = min(last * 4, HISTORY[period])
+            except iexclient.FALLBACK_ERRORS:
+                if not have:
+                    raise
+                self.mark_synced(series, period, symbol, time.time() + RETRY_AFTER)
+                return 0
+            added = self.append(series, period, symbol, new)
+            filings = self.table(series, period, symbol).column('filingDate').to_pylist()
+            ttl = iexclient.fundamentals_ttl([{'filingDate': d} for d in filings if d])
+            self.mark_synced(series, period, symbol, time.time() + ttl)
+            return added
+
+    def frame(self, series, period, symbols, start_year=None, end_year=None):
+        """Stored periods for symbols within [start_year, end_year], shaped like fundamentals.to_frame
+        plus the fiscalYear and fiscalQuarter key: indexed by (symbol, period) with period 0 the most recent.
+        """
+        tables = []
+        for symbol in symbols:
+            table = self.table(series, period, symbol)
+            mask = None
+            if start_year is not None:
+                mask = pc.greater_equal(table.column('fiscalYear'), start_year)
+            if end_year is not None:
+                upper = pc.less_equal(table.column('fiscalYear'), end_year)
+                mask = upper if mask is None else pc.and_(mask, upper)
+            if mask is not None:
+                table = table.filter(mask)
+            tables.append(table.append_column('symbol', pa.array([symbol] * len(table), pa.string())))
+        columns = fundamentals_columns(series)
+        if not tables:
+            df = pd.DataFrame(columns=list(columns)).astype(columns)
+            df.index = pd.MultiIndex.from_arrays([[], []], names=['symbol', 'period'])
+            return df
+        df = pa.concat_tables(tables).to_pandas()
+        # two processes syncing at once can both add a period
+        df = df.drop_duplicates(['symbol'] + KEY)
+        df = df.sort_values(['symbol'] + KEY, ascending=[True, False, False], kind='stable')
+        periods = df.groupby('symbol', sort=False).cumcount().to_numpy(dtype=np.int64)
+        df.index = pd.MultiIndex.from_arrays([df['symbol'].to_numpy(dtype=object), periods], names=['symbol', 'period'])
+        return df[list(columns)].astype(columns)
+
+
+def fundamentals_columns(series):
+    columns = fundamentals.FUNDAMENTALS_COLUMNS if series == 'fundamentals' else fundamentals.VALUATIONS_COLUMNS
+    return {**{k: 'Int64' for k in KEY}, **columns}
+
+
+def _table(series, rows):
+    df = pd.DataFrame(records.columns(rows, COLUMNS[series]), columns=list(COLUMNS[series])).astype(COLUMNS[series])
+    return pa.Table.from_pandas(df, schema=schema(series), preserve_index=False)
+
+
+def _read(path):
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _write(path, table):
+    # write next to the final name and rename, so readers never see half a file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+store = TimeSeriesStore()
+
+
+def sync_calls(stock, period='annual'):
+    """Zero-argument callables that sync an IEXStock's fundamentals and valuations, for iexclient.fetch_all"""
+    return [lambda: store.sync('fundamentals', period, stock.symbol,
+                               lambda last: stock.get_fundamentalsannual(period, last=last)),
+            lambda: store.sync('FUNDAMENTAL_VALUATIONS', period, stock.symbol,
+                               lambda last: stock.get_fundamentalsannual1(period, last=last))]
+
+
+def sync_quarters(stock):
+    """Sync an IEXStock's quarterly fundamentals, for iexclient.fetch_all"""
+    return store.sync('fundamentals', 'quarterly', stock.symbol,
+                      lambda last: stock.get_fundamentalsquarterly('quarterly', last=last))
+
+
+def quarters(symbol, count=4):
+    """A symbol's count most recent stored quarterly filings as FundamentalsPeriod records, newest first"""
+    rows = {(row['fiscalYear'] or 0, row['fiscalQuarter'] or 0): row
+            for row in store.table('fundamentals', 'quarterly', symbol).to_pylist()}
+    return [records.FundamentalsPeriod.parse(rows[key]) for key in sorted(rows, reverse=True)[:count]]
+
+
+def version(symbols, period='annual'):
+    """Store version of everything load(symbols, period) reads"""
+    return tuple(store.version(series, period, symbol) for symbol in symbols for series in FUNDAMENTALS_SERIES)
+
+
+def load(symbols, period='annual', start_year=None, end_year=None):
+    """fundamentals.build_metrics over the stored periods of symbols within [start_year, end_year]"""
+    # one extra year so growth is defined for start_year
+    first = start_year - 1 if start_year is not None else None
+    # the two series sync separately, so one can have a year the other doesn't yet:
+    # match them on the fiscal period, then number the periods
+    keys = ['symbol'] + KEY
+    fundamental, valuation = (store.frame(series, period, symbols, first, end_year).droplevel('period').reset_index()
+                              for series in FUNDAMENTALS_SERIES)
+    merged = fundamental.merge(valuation, on=keys, how='outer')
+    merged = merged.sort_values(keys, ascending=[True, False, False], kind='stable')
+    periods = merged.groupby('symbol', sort=False).cumcount().to_numpy(dtype=np.int64)
+    merged.index = pd.MultiIndex.from_arrays([merged['symbol'].to_numpy(dtype=object), periods], names=['symbol', 'period'])
+    metrics = fundamentals.build_metrics(merged[list(fundamentals.FUNDAMENTALS_COLUMNS)],
+                                         merged[list(fundamentals.VALUATIONS_COLUMNS)])
+    if start_year is not None:
+        metrics = metrics[(metrics['fiscalYear'] >= start_year).fillna(False).to_numpy()]
+    return metrics
@@ -0,0 +1,129 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Builds the UT Analysis sheet for a list of symbols without the browser, e.g.
+# as a nightly job:
+#   python utbatch.py --symbols-file tickers.txt --out ut_analysis.xlsx
+#   python utbatch.py AAPL MSFT TSLA --split exports/ --format csv
+# Symbols are split into chunks and processed by worker processes. The
+# processes share the response cache, the time-series store and the credit
+# budget through their files on disk, so re-runs only fetch what's new.
+
+CHUNK = 25  # symbols per worker task; each chunk's requests run concurrently
+
+
+def build_chunk(symbols, token, environment):
+    """Worker task: {symbol: UT Analysis frame} for the symbols that worked, and {symbol: error}"""
+    import warnings
+    warnings.simplefilter('ignore')  # Streamlit and pandas warnings, once per symbol otherwise
+
+    import planner
+    from Stockdata import SCREEN_FIELDS, IEXStock, ut_table  # importing Stockdata doesn't render the app
+
+    result = planner.plan(SCREEN_FIELDS['UT Analysis'], symbols).run(
+        lambda symbol: IEXStock(token, symbol, environment=environment), return_exceptions=True)
+    tables, errors = {}, {}
+    stored = set(result.metrics.index.get_level_values('symbol'))
+    for symbol in symbols:
+        if symbol in result.failed:
+            errors[symbol] = _describe(result.failed[symbol])
+            continue
+        try:
+            if symbol not in stored:
+                raise ValueError('no fundamentals stored')
+            tables[symbol] = ut_table(symbol, result.metrics.loc[symbol])
+        except (KeyError, ValueError) as e:  # fewer than three fiscal years, or none
+            errors[symbol] = _describe(e)
+    return tables, errors
+
+
+def _describe(error):
+    # HTTP errors quote the request URL, token included
+    return re.sub(r'token=[^&\s\'"]*', 'token=...', repr(error))
+
+
+def run(symbols, token, environment, workers, chunk=CHUNK, progress=None):
+    """({symbol: frame}, {symbol: error}) for every symbol, in the order given"""
+    chunks = [symbols[i:i + chunk] for i in range(0, len(symbols), chunk)]
+    tables, errors = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_chunk, c, token, environment): c for c in chunks}
+        for future in as_completed(futures):
+            try:
+                done, failed = future.result()
+            except Exception as e:  # the worker itself died
+                done, failed = {}, {symbol: _describe(e) for symbol in futures[future]}
+            tables.update(done)
+            errors.update(failed)
+            if progress:
+                progress(len(tables), len(errors), len(symbols))
+    order = {symbol: i for i, symbol in enumerate(symbols)}
+    return (dict(sorted(tables.items(), key=lambda item: order[item[0]])),
+            dict(sorted(errors.items(), key=lambda item: order[item[0]])))
+
+
+def read_symbols(args):
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols += f.read().replace(',', ' ').split()
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write UT Analysis sheets for many symbols')
+    parser.add_argument('symbols', nargs='*')
+    parser.add_argument('--symbols-file', help='file of symbols separated by whitespace or commas')
+    parser.add_argument('--out', default='ut_analysis.xlsx', help='one workbook with a sheet per symbol')
+    parser.add_argument('--split', metavar='DIR', help='write one file per symbol into DIR instead')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='worker processes')
+    parser.add_argument('--chunk', type=int, default=CHUNK, help='symbols per worker task')
+    parser.add_argument('--token', default=os.environ.get('IEX_TOKEN', ''))
+    parser.add_argument('--environment', default=os.environ.get('IEX_ENVIRONMENT', 'production'))
+    parser.add_argument('--failures', help='also write failed symbols and their errors to this file')
+    args = parser.parse_args()
+    symbols = read_symbols(args)
+    if not symbols:
+        parser.error('no symbols given')
+
+    import export
+
+    def progress(done, failed, total):
+        print(f"\r{done + failed}/{total} symbols, {failed} failed", end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    tables, errors = run(symbols, args.token, args.environment, args.workers, args.chunk, progress)
+    fetched = time.perf_counter() - start
+    print(file=sys.stderr)
+
+    if args.split:
+        os.makedirs(args.split, exist_ok=True)
+        for symbol, df in tables.items():
+            sheets = {'UT Analysis': df}
+            export.write(sheets, args.format, os.path.join(args.split, export.file_name(f"{symbol} UT Analysis", args.format, sheets)))
+        written = args.split
+    elif tables:
+        written = export.file_name(os.path.splitext(args.out)[0], args.format, tables)
+        export.write(tables, args.format, written)
+    else:
+        written = 'nothing'
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(tables)} of {len(symbols)} symbols written to {written} in {elapsed:.1f}s "
+          f"({len(symbols) / fetched:.1f} symbols/s fetching, {args.workers} workers)")
+    for symbol, error in errors.items():
+        print(f"  failed {symbol}: {error}")
+    if args.failures:
+        with open(args.failures, 'w') as f:
+            f.writelines(f"{symbol}\t{error}\n" for symbol, error in errors.items())
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()